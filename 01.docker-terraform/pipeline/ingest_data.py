@@ -1,11 +1,34 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import io
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
 import click
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, text
 from tqdm.auto import tqdm
 
+# The shared download cache lives in common/ at the repository root. The
+# Docker image only ships this file, so there it downloads without caching.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / 'common'))
+try:
+    from download_cache import fetch
+except ImportError:
+    fetch = None
+
 dtype = {
     "VendorID": "Int64",
     "passenger_count": "Int64",
@@ -30,48 +53,757 @@ parse_dates = [
     "tpep_dropoff_datetime"
 ]
 
+taxi_parse_dates = {
+    "yellow": parse_dates,
+    "green": ["lpep_pickup_datetime", "lpep_dropoff_datetime"],
+}
 
-@click.command()
-@click.option('--pg-user', default='root', help='PostgreSQL user')
-@click.option('--pg-pass', default='root', help='PostgreSQL password')
-@click.option('--pg-host', default='localhost', help='PostgreSQL host')
-@click.option('--pg-port', default=5432, type=int, help='PostgreSQL port')
-@click.option('--pg-db', default='ny_taxi', help='PostgreSQL database name')
-@click.option('--year', default=2021, type=int, help='Year of the data')
-@click.option('--month', default=1, type=int, help='Month of the data')
-@click.option('--target-table', default='yellow_taxi_data', help='Target table name')
-@click.option('--chunksize', default=100000, type=int, help='Chunk size for reading CSV')
-def run(pg_user, pg_pass, pg_host, pg_port, pg_db, year, month, target_table, chunksize):
-    """Ingest NYC taxi data into PostgreSQL database."""
-    prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-    url = f'{prefix}/yellow_tripdata_{year}-{month:02d}.csv.gz'
-
-    engine = create_engine(f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}')
-
-    df_iter = pd.read_csv(
-        url,
-        dtype=dtype,
-        parse_dates=parse_dates,
-        iterator=True,
-        chunksize=chunksize,
+
+# Arrow equivalents of dtype/parse_dates, so Parquet chunks are cast once in
+# Arrow and end up with the same column types as the CSV path
+arrow_dtype = {
+    "Int64": pa.int64(),
+    "float64": pa.float64(),
+    "string": pa.string(),
+}
+
+# The TLC Parquet files change columns over the years (airport_fee is
+# Airport_fee in some, cbd_congestion_fee appears in 2025), so every month is
+# read into one fixed column list per taxi type. Names are matched ignoring
+# case and columns a month lacks are null, so all months of a partitioned
+# table share its columns.
+parquet_columns = {
+    "yellow": [
+        "VendorID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count", "trip_distance",
+        "RatecodeID", "store_and_fwd_flag", "PULocationID", "DOLocationID", "payment_type", "fare_amount",
+        "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount",
+        "congestion_surcharge", "airport_fee", "cbd_congestion_fee",
+    ],
+    "green": [
+        "VendorID", "lpep_pickup_datetime", "lpep_dropoff_datetime", "store_and_fwd_flag", "RatecodeID",
+        "PULocationID", "DOLocationID", "passenger_count", "trip_distance", "fare_amount", "extra", "mta_tax",
+        "tip_amount", "tolls_amount", "ehail_fee", "improvement_surcharge", "total_amount", "payment_type",
+        "trip_type", "congestion_surcharge", "cbd_congestion_fee",
+    ],
+}
+
+# Types of the Parquet-only columns, on top of dtype
+parquet_dtype = {
+    **dtype,
+    "airport_fee": "float64",
+    "cbd_congestion_fee": "float64",
+    "ehail_fee": "float64",
+    "trip_type": "Int64",
+}
+
+pandas_types = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.string(): pd.StringDtype(),
+}
+
+
+def source_url(taxi_type, year, month, source_format='csv'):
+    if source_format == 'parquet':
+        prefix = 'https://d37ci6vzurychx.cloudfront.net/trip-data'
+        return f'{prefix}/{taxi_type}_tripdata_{year}-{month:02d}.parquet'
+    prefix = f'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/{taxi_type}'
+    return f'{prefix}/{taxi_type}_tripdata_{year}-{month:02d}.csv.gz'
+
+
+@contextmanager
+def local_copy(url):
+    """Yield a local path for url, from the download cache when available."""
+    if fetch is not None:
+        yield fetch(url)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / url.rsplit('/', 1)[1]
+        with urllib.request.urlopen(url) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f, length=1024 * 1024)
+        yield path
+
+
+def csv_chunks(url, taxi_type, chunksize, skip_rows):
+    """Yield DataFrame chunks, indexed by row number within the file."""
+    with local_copy(url) as path:
+        # Rows of the committed prefix are skipped by the tokenizer, not parsed
+        df_iter = pd.read_csv(
+            path,
+            dtype=dtype,
+            parse_dates=taxi_parse_dates[taxi_type],
+            iterator=True,
+            chunksize=chunksize,
+            skiprows=range(1, skip_rows + 1),
+        )
+        for df_chunk in df_iter:
+            df_chunk.index += skip_rows
+            yield df_chunk
+
+
+def arrow_schema(taxi_type):
+    """Return the fixed Parquet columns of taxi_type with their CSV types."""
+    timestamps = set(taxi_parse_dates[taxi_type])
+    return pa.schema([
+        (name, pa.timestamp('us') if name in timestamps else arrow_dtype[parquet_dtype[name]])
+        for name in parquet_columns[taxi_type]
+    ])
+
+
+def source_columns(source_schema, schema):
+    """Map each column of schema to the source column of the same name, ignoring case."""
+    by_name = {name.lower(): name for name in source_schema.names}
+    ignored = set(source_schema.names) - {by_name.get(name.lower()) for name in schema.names}
+    if ignored:
+        tqdm.write(f'Ignoring columns not in the fixed column list: {", ".join(sorted(ignored))}')
+    return {name: by_name.get(name.lower()) for name in schema.names}
+
+
+def parquet_chunks(url, taxi_type, chunksize, skip_rows):
+    """Yield Arrow tables of exactly chunksize rows read from a Parquet file.
+
+    The file is read as record batches and cast in Arrow to the fixed
+    columns of arrow_schema(), never row by row. Chunks carry the row number within the file as an `index` column, the
+    same values the CSV path has in its DataFrame index.
+    """
+    with local_copy(url) as path:
+        parquet = pq.ParquetFile(path)
+        schema = arrow_schema(taxi_type)
+        sources = source_columns(parquet.schema_arrow, schema)
+
+        # Whole row groups before the resume point are never decoded
+        first_group, position = 0, 0
+        while first_group < parquet.num_row_groups:
+            group_rows = parquet.metadata.row_group(first_group).num_rows
+            if position + group_rows > skip_rows:
+                break
+            position += group_rows
+            first_group += 1
+
+        def chunk(table):
+            # A chunk can straddle two batches; combining keeps every column in
+            # one contiguous chunk, which Arrow's CSV writer needs to line up rows
+            index = pa.array(np.arange(position, position + table.num_rows))
+            columns = [
+                table.column(sources[field.name]).cast(field.type) if sources[field.name]
+                else pa.nulls(table.num_rows, field.type)
+                for field in schema
+            ]
+            table = pa.Table.from_arrays(columns, schema=schema)
+            return table.combine_chunks().add_column(0, 'index', index)
+
+        buffered = parquet.schema_arrow.empty_table()
+        batches = parquet.iter_batches(
+            batch_size=chunksize,
+            row_groups=range(first_group, parquet.num_row_groups),
+        )
+        for batch in batches:
+            if position < skip_rows:
+                cut = min(skip_rows - position, batch.num_rows)
+                batch = batch.slice(cut)
+                position += cut
+
+            # Re-cut batches on chunksize so chunk boundaries match the ledger
+            buffered = pa.concat_tables([buffered, pa.Table.from_batches([batch])])
+            while buffered.num_rows >= chunksize:
+                yield chunk(buffered.slice(0, chunksize))
+                buffered = buffered.slice(chunksize)
+                position += chunksize
+
+        if buffered.num_rows:
+            yield chunk(buffered)
+
+
+chunk_readers = {
+    'csv': csv_chunks,
+    'parquet': parquet_chunks,
+}
+
+
+def as_frame(chunk):
+    """Return a chunk as a DataFrame; Arrow chunks carry their index as a column."""
+    if isinstance(chunk, pd.DataFrame):
+        return chunk
+    return chunk.to_pandas(types_mapper=pandas_types.get).set_index('index')
+
+
+def insert_chunk(df_chunk, conn, target_table):
+    """Append a chunk with DataFrame.to_sql (row-wise INSERTs)."""
+    as_frame(df_chunk).to_sql(
+        name=target_table,
+        con=conn,
+        if_exists='append'
     )
 
-    first = True
 
-    for df_chunk in tqdm(df_iter):
-        if first:
-            df_chunk.head(0).to_sql(
-                name=target_table,
-                con=engine,
-                if_exists='replace'
+def copy_chunk(df_chunk, conn, target_table):
+    """Append a chunk by streaming it as CSV through COPY ... FROM STDIN.
+
+    The table is still created by to_sql from the dtype/parse_dates frame, so
+    the index column is written too to keep the same layout as insert_chunk.
+    Arrow chunks are written by Arrow's CSV writer without a pandas detour.
+    """
+    if isinstance(df_chunk, pd.DataFrame):
+        buffer = io.StringIO()
+        df_chunk.to_csv(buffer, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+        columns = [df_chunk.index.name or 'index', *df_chunk.columns]
+    else:
+        buffer = io.BytesIO()
+        pa_csv.write_csv(df_chunk, buffer, pa_csv.WriteOptions(include_header=False))
+        columns = df_chunk.schema.names
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    sql = f'COPY "{target_table}" ({column_list}) FROM STDIN WITH (FORMAT csv)'
+
+    # Runs on the DBAPI connection behind `conn`, inside its open transaction
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+
+
+load_methods = {
+    'insert': insert_chunk,
+    'copy': copy_chunk,
+}
+
+
+ledger_table = 'ingest_ledger'
+
+
+def source_metadata(url):
+    """Return (etag, size) of the source file from a HEAD request."""
+    request = urllib.request.Request(url, method='HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            size = response.headers.get('Content-Length')
+            return response.headers.get('ETag'), int(size) if size else None
+    except OSError as e:
+        print(f'Could not read source metadata for {url}: {e}')
+        return None, None
+
+
+def create_ledger(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {ledger_table} (
+                table_name  text        NOT NULL,
+                year        integer     NOT NULL,
+                month       integer     NOT NULL,
+                chunk_index integer     NOT NULL,
+                row_count   bigint      NOT NULL,
+                source_etag text,
+                source_size bigint,
+                loaded_at   timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (table_name, year, month, chunk_index)
             )
-            first = False
+        """))
+
+
+def committed_chunks(engine, target_table, year, month, etag, size):
+    """Return {chunk_index: row_count} already committed for this source file.
+
+    Entries recorded against a different etag/size belong to an older version
+    of the file and are ignored, which makes the caller start over.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT chunk_index, row_count, source_etag, source_size
+            FROM {ledger_table}
+            WHERE table_name = :table_name AND year = :year AND month = :month
+        """), {'table_name': target_table, 'year': year, 'month': month}).fetchall()
 
-        df_chunk.to_sql(
+    if any((row.source_etag, row.source_size) != (etag, size) for row in rows):
+        print('Source file changed since the last run, starting over')
+        return {}
+    return {row.chunk_index: row.row_count for row in rows}
+
+
+def record_chunk(conn, target_table, year, month, chunk_index, row_count, etag, size):
+    conn.execute(text(f"""
+        INSERT INTO {ledger_table}
+            (table_name, year, month, chunk_index, row_count, source_etag, source_size)
+        VALUES (:table_name, :year, :month, :chunk_index, :row_count, :etag, :size)
+    """), {
+        'table_name': target_table, 'year': year, 'month': month, 'chunk_index': chunk_index,
+        'row_count': row_count, 'etag': etag, 'size': size,
+    })
+
+
+def reset_table(engine, df_chunk, target_table, defer_indexes=False):
+    """Replace the target table and forget every chunk recorded against it.
+
+    With defer_indexes the index to_sql creates is dropped again, so the load
+    does not maintain it row by row; build_indexes puts it back afterwards.
+    """
+    empty = df_chunk.head(0) if isinstance(df_chunk, pd.DataFrame) else as_frame(df_chunk.slice(0, 0))
+    with engine.begin() as conn:
+        empty.to_sql(
             name=target_table,
-            con=engine,
-            if_exists='append'
+            con=conn,
+            if_exists='replace'
+        )
+        if defer_indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index_name(target_table, "index")}"'))
+        conn.execute(
+            text(f'DELETE FROM {ledger_table} WHERE table_name = :table_name'),
+            {'table_name': target_table},
+        )
+
+
+def index_name(table, column):
+    # Same naming as the ix_<table>_index that to_sql creates
+    return f'ix_{table}_{column}'
+
+
+def build_indexes(engine, table, columns):
+    for column in columns:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS "{index_name(table, column)}" ON "{table}" ("{column}")'
+            ))
+        print(f'Indexed {table}.{column} in {time.perf_counter() - started:.1f}s')
+
+
+def resume_point(committed, chunksize):
+    """Return (first missing chunk index, rows before it) for a resumed run."""
+    last = max(committed, default=-1)
+    if any(rows != chunksize for index, rows in committed.items() if index != last):
+        raise click.UsageError(
+            'The ledger was written with a different --chunksize; '
+            'rerun with the original value or pass --no-resume'
+        )
+
+    start = 0
+    while start in committed:
+        start += 1
+    return start, start * chunksize
+
+
+def load_pipelined(chunks, load, writers, queue_depth):
+    """Parse chunks on the calling thread while `writers` threads load them.
+
+    At most writers + queue_depth parsed chunks are held in memory; the reader
+    blocks on the semaphore once that many are waiting or being written.
+    """
+    slots = threading.BoundedSemaphore(writers + queue_depth)
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix='writer') as pool:
+        try:
+            for index, df_chunk in chunks:
+                slots.acquire()
+                future = pool.submit(load, index, df_chunk)
+                future.add_done_callback(lambda _: slots.release())
+                pending.add(future)
+
+                done = {f for f in pending if f.done()}
+                pending -= done
+                for f in done:
+                    f.result()
+
+            for f in pending:
+                f.result()
+        except BaseException:
+            for f in pending:
+                f.cancel()
+            raise
+
+
+def ingest_month(engine, taxi_type, year, month, target_table, chunksize, load_method,
+                 writers=0, queue_depth=2, resume=True, defer_indexes=False, source_format='csv'):
+    """Load one month into target_table and return (rows, source bytes)."""
+    url = source_url(taxi_type, year, month, source_format)
+
+    create_ledger(engine)
+    etag, size = source_metadata(url)
+    committed = committed_chunks(engine, target_table, year, month, etag, size) if resume else {}
+    start, skip_rows = resume_point(committed, chunksize)
+    if committed:
+        print(f'Resuming {target_table} at chunk {start}, {len(committed)} chunk(s) already committed')
+
+    chunk_iter = chunk_readers[source_format](url, taxi_type, chunksize, skip_rows)
+    load_chunk = load_methods[load_method]
+    loaded_rows = sum(committed.values())
+    # Writer threads finish chunks concurrently
+    loaded_rows_lock = threading.Lock()
+
+    def load(index, df_chunk):
+        nonlocal loaded_rows
+        started = time.perf_counter()
+        # The chunk and its ledger entry commit or roll back together
+        with engine.begin() as conn:
+            load_chunk(df_chunk, conn, target_table)
+            record_chunk(conn, target_table, year, month, index, len(df_chunk), etag, size)
+        elapsed = time.perf_counter() - started
+        with loaded_rows_lock:
+            loaded_rows += len(df_chunk)
+
+        tqdm.write(
+            f'{target_table} chunk {index}: {len(df_chunk)} rows in {elapsed:.2f}s '
+            f'({len(df_chunk) / elapsed:,.0f} rows/s, {load_method})'
+        )
+
+    def chunks():
+        # The table is replaced by the reader before the first chunk is handed
+        # to any writer, so it happens exactly once whatever the writer count.
+        # A resumed run never replaces it.
+        for index, df_chunk in enumerate(tqdm(chunk_iter, desc=target_table), start=start):
+            if not committed and index == 0:
+                reset_table(engine, df_chunk, target_table, defer_indexes)
+            if index in committed or len(df_chunk) == 0:
+                continue
+            yield index, df_chunk
+
+    if writers:
+        load_pipelined(chunks(), load, writers, queue_depth)
+    else:
+        for index, df_chunk in chunks():
+            load(index, df_chunk)
+
+    return loaded_rows, size
+
+
+def month_range(start, end):
+    """Yield (year, month) from start to end inclusive."""
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_name(target_table, year, month):
+    return f'{target_table}_{year}_{month:02d}'
+
+
+def create_partitioned_table(conn, target_table, template_table, taxi_type):
+    """Create target_table range-partitioned by pickup time if it is missing.
+
+    Rows whose pickup falls outside their file's month (the TLC files carry a
+    few) land in a DEFAULT partition so every month can still be attached.
+    """
+    kind = conn.execute(
+        text('SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)'),
+        {'name': target_table},
+    ).scalar()
+    if kind == 'r':
+        raise click.ClickException(
+            f'{target_table} already exists as a plain table; drop it or pick another --target-table'
         )
 
+    pickup = taxi_parse_dates[taxi_type][0]
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{target_table}" (LIKE "{template_table}")
+        PARTITION BY RANGE ("{pickup}")
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{target_table}_default"
+        PARTITION OF "{target_table}" DEFAULT
+    """))
+
+
+def create_parent_indexes(conn, target_table, columns):
+    """Create the partitioned indexes that each attached partition's index joins.
+
+    Partitions that already carry a matching index are attached to it as is,
+    so these are only built from scratch the first time a column is added.
+    """
+    for column in columns:
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS "{index_name(target_table, column)}" '
+            f'ON "{target_table}" ("{column}")'
+        ))
+
+
+def swap_in_partition(conn, target_table, staging_table, taxi_type, year, month):
+    """Replace the month's partition of target_table with staging_table.
+
+    Meant to run inside the caller's transaction so several months swap in
+    atomically. Rows of the file picked up outside the month are set aside
+    in a temporary table whose name is returned; pass it to insert_strays
+    once every month of the transaction is attached, so a stray row lands in
+    its month's new partition rather than one about to be replaced.
+    """
+    pickup = taxi_parse_dates[taxi_type][0]
+    partition = partition_name(target_table, year, month)
+    strays_table = f'{staging_table}_strays'
+    lower = f'{year}-{month:02d}-01'
+    upper = f'{year + month // 12}-{month % 12 + 1:02d}-01'
+    in_range = f""""{pickup}" >= '{lower}' AND "{pickup}" < '{upper}'"""
+
+    conn.execute(text(f"""
+        CREATE TEMP TABLE "{strays_table}" ON COMMIT DROP AS
+        SELECT * FROM "{staging_table}" WHERE NOT ({in_range}) OR "{pickup}" IS NULL
+    """))
+    conn.execute(text(f"""
+        DELETE FROM "{staging_table}" WHERE NOT ({in_range}) OR "{pickup}" IS NULL
+    """))
+
+    # Strays of other files that were parked in the default partition while
+    # this month had none move into it, or ATTACH would fail its default scan
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM "{target_table}_default" WHERE {in_range} RETURNING *
+        )
+        INSERT INTO "{staging_table}" SELECT * FROM moved
+    """))
+
+    # A matching CHECK constraint lets ATTACH skip its validation scan
+    conn.execute(text(f"""
+        ALTER TABLE "{staging_table}" ADD CONSTRAINT "{staging_table}_range"
+        CHECK ({in_range} AND "{pickup}" IS NOT NULL)
+    """))
+
+    existing = conn.execute(text('SELECT to_regclass(:name)'), {'name': partition}).scalar()
+    if existing is not None:
+        conn.execute(text(f'ALTER TABLE "{target_table}" DETACH PARTITION "{partition}"'))
+        conn.execute(text(f'DROP TABLE "{partition}"'))
+
+    conn.execute(text(f'ALTER TABLE "{staging_table}" RENAME TO "{partition}"'))
+    # Index names carry the table name, keep them in step with the rename
+    staging_indexes = conn.execute(
+        text('SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE :prefix'),
+        {'table': partition, 'prefix': f'ix_{staging_table}_%'},
+    ).scalars().all()
+    for name in staging_indexes:
+        renamed = name.replace(f'ix_{staging_table}_', f'ix_{partition}_', 1)
+        conn.execute(text(f'ALTER INDEX "{name}" RENAME TO "{renamed}"'))
+    conn.execute(text(f"""
+        ALTER TABLE "{target_table}" ATTACH PARTITION "{partition}"
+        FOR VALUES FROM ('{lower}') TO ('{upper}')
+    """))
+    conn.execute(text(f'ALTER TABLE "{partition}" DROP CONSTRAINT "{staging_table}_range"'))
+
+    # The staging table is gone, so its ledger entries no longer describe anything
+    conn.execute(
+        text(f'DELETE FROM {ledger_table} WHERE table_name = :table_name'),
+        {'table_name': staging_table},
+    )
+    return strays_table
+
+
+def insert_strays(conn, target_table, strays_table, taxi_type):
+    """Insert the stray rows set aside by swap_in_partition through the parent.
+
+    Each row is routed to its own month's partition, or the default one if
+    that month has none. EXCEPT keeps a reloaded month from duplicating its
+    strays; it only compares rows with the same pickup time, found by the
+    pickup index.
+    """
+    pickup = taxi_parse_dates[taxi_type][0]
+    conn.execute(text(f"""
+        INSERT INTO "{target_table}"
+        SELECT * FROM "{strays_table}"
+        EXCEPT
+        SELECT * FROM "{target_table}"
+        WHERE "{pickup}" IN (SELECT "{pickup}" FROM "{strays_table}") OR "{pickup}" IS NULL
+    """))
+    conn.execute(text(f'DROP TABLE "{strays_table}"'))
+
+
+def partition_index_columns(taxi_type, index_columns):
+    """to_sql's index column plus the requested ones, pickup time by default."""
+    return ['index', *(index_columns or [taxi_parse_dates[taxi_type][0]])]
+
+
+def load_partition(engine, taxi_type, year, month, target_table, chunksize, load_method, index_columns,
+                   writers=0, queue_depth=2, resume=True, source_format='csv'):
+    """Load one month into a standalone staging table and index it once loaded.
+
+    Returns (staging table, rows, source bytes); swap_in_partition attaches it.
+    """
+    staging_table = f'{partition_name(target_table, year, month)}_staging'
+    rows, size = ingest_month(
+        engine, taxi_type, year, month, staging_table, chunksize, load_method,
+        writers=writers, queue_depth=queue_depth, resume=resume, defer_indexes=True,
+        source_format=source_format,
+    )
+    build_indexes(engine, staging_table, partition_index_columns(taxi_type, index_columns))
+    return staging_table, rows, size
+
+
+def backfill_month(url, taxi_type, year, month, target_table, chunksize, load_method, connections,
+                   queue_depth, index_columns, source_format):
+    """Process pool worker: load and index one month in its staging table."""
+    engine = create_engine(url, pool_size=connections, max_overflow=0)
+    started = time.perf_counter()
+    try:
+        staging_table, rows, size = load_partition(
+            engine, taxi_type, year, month, target_table, chunksize, load_method, index_columns,
+            writers=connections if connections > 1 else 0,
+            queue_depth=queue_depth,
+            source_format=source_format,
+        )
+    finally:
+        engine.dispose()
+    return staging_table, rows, size, time.perf_counter() - started
+
+
+def pg_options(command):
+    options = [
+        click.option('--pg-user', default='root', help='PostgreSQL user'),
+        click.option('--pg-pass', default='root', help='PostgreSQL password'),
+        click.option('--pg-host', default='localhost', help='PostgreSQL host'),
+        click.option('--pg-port', default=5432, type=int, help='PostgreSQL port'),
+        click.option('--pg-db', default='ny_taxi', help='PostgreSQL database name'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+class DefaultRunGroup(click.Group):
+    """Runs `run` unless the first argument names a command.
+
+    Keeps the invocations from before `backfill` existed working, e.g. the
+    Docker image's `docker run taxi_ingest --pg-user ...`.
+    """
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args = ['run', *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultRunGroup)
+def cli():
+    """Ingest NYC taxi data into PostgreSQL database (`run` unless another command is given)."""
+
+
+@cli.command()
+@pg_options
+@click.option('--taxi-type', default='yellow', type=click.Choice(list(taxi_parse_dates)), help='Taxi type')
+@click.option('--year', default=2021, type=int, help='Year of the data')
+@click.option('--month', default=1, type=int, help='Month of the data')
+@click.option('--target-table', default='yellow_taxi_data', help='Target table name')
+@click.option('--chunksize', default=100000, type=int, help='Rows per chunk (CSV chunk or Parquet record batch)')
+@click.option('--source-format', default='csv', type=click.Choice(list(chunk_readers)),
+              help='csv parses the gzip CSV with pandas, parquet reads the TLC Parquet file with pyarrow')
+@click.option('--load-method', default='insert', type=click.Choice(list(load_methods)),
+              help='insert uses DataFrame.to_sql, copy streams chunks through COPY FROM STDIN')
+@click.option('--writers', default=0, type=click.IntRange(min=0),
+              help='Writer threads loading chunks while the next ones are parsed (0 loads inline)')
+@click.option('--queue-depth', default=2, type=click.IntRange(min=0),
+              help='Parsed chunks allowed to wait for a free writer')
+@click.option('--resume/--no-resume', default=True,
+              help='Skip chunks the ledger already has for this month instead of reloading the table')
+@click.option('--partitioned', is_flag=True,
+              help='Load into a table range-partitioned by pickup month, replacing only this month')
+@click.option('--index-column', 'index_columns', multiple=True,
+              help='Column indexed after each partition is loaded, repeat for several (default: pickup time)')
+def run(pg_user, pg_pass, pg_host, pg_port, pg_db, taxi_type, year, month, target_table, chunksize,
+        source_format, load_method, writers, queue_depth, resume, partitioned, index_columns):
+    """Ingest a single month into a table.
+
+    By default the month replaces the whole table. With --partitioned it is
+    loaded into a staging table, indexed, and swapped in as the month's
+    partition, leaving the other months alone.
+    """
+    # One pooled connection per writer, so concurrent chunks never share one
+    engine = create_engine(
+        f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}',
+        pool_size=max(writers, 1),
+        max_overflow=0,
+    )
+
+    if not partitioned:
+        ingest_month(
+            engine, taxi_type, year, month, target_table, chunksize, load_method,
+            writers=writers, queue_depth=queue_depth, resume=resume, source_format=source_format,
+        )
+        return
+
+    staging_table, _, _ = load_partition(
+        engine, taxi_type, year, month, target_table, chunksize, load_method, index_columns,
+        writers=writers, queue_depth=queue_depth, resume=resume, source_format=source_format,
+    )
+    with engine.begin() as conn:
+        create_partitioned_table(conn, target_table, staging_table, taxi_type)
+        create_parent_indexes(conn, target_table, partition_index_columns(taxi_type, index_columns))
+        strays_table = swap_in_partition(conn, target_table, staging_table, taxi_type, year, month)
+        insert_strays(conn, target_table, strays_table, taxi_type)
+
+
+@cli.command()
+@pg_options
+@click.option('--taxi-type', 'taxi_types', multiple=True, default=['yellow'],
+              type=click.Choice(list(taxi_parse_dates)), help='Taxi type, repeat for several')
+@click.option('--start', required=True, type=click.DateTime(formats=['%Y-%m']), help='First month, YYYY-MM')
+@click.option('--end', required=True, type=click.DateTime(formats=['%Y-%m']), help='Last month, YYYY-MM')
+@click.option('--target-table', default='{taxi_type}_taxi_data',
+              help='Partitioned target table, {taxi_type} is substituted')
+@click.option('--workers', default=4, type=click.IntRange(min=1), help='Months loaded in parallel')
+@click.option('--connections-per-worker', default=1, type=click.IntRange(min=1),
+              help='Connection limit of each worker; above 1 the month is loaded by that many writers')
+@click.option('--chunksize', default=100000, type=int, help='Rows per chunk (CSV chunk or Parquet record batch)')
+@click.option('--source-format', default='csv', type=click.Choice(list(chunk_readers)),
+              help='csv parses the gzip CSV with pandas, parquet reads the TLC Parquet file with pyarrow')
+@click.option('--load-method', default='copy', type=click.Choice(list(load_methods)),
+              help='insert uses DataFrame.to_sql, copy streams chunks through COPY FROM STDIN')
+@click.option('--queue-depth', default=2, type=click.IntRange(min=0),
+              help='Parsed chunks allowed to wait for a free writer')
+@click.option('--index-column', 'index_columns', multiple=True,
+              help='Column indexed after each partition is loaded, repeat for several (default: pickup time)')
+def backfill(pg_user, pg_pass, pg_host, pg_port, pg_db, taxi_types, start, end, target_table, workers,
+             connections_per_worker, chunksize, source_format, load_method, queue_depth, index_columns):
+    """Load a range of months in parallel and swap them into partitioned tables.
+
+    Each month is loaded into its own staging table by a process pool. Once
+    all workers are done, the loaded months replace their partitions in one
+    transaction, so readers see either the old or the new data.
+    """
+    url = f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}'
+    months = [
+        (taxi_type, year, month)
+        for taxi_type in taxi_types
+        for year, month in month_range(start, end)
+    ]
+
+    create_ledger(create_engine(url))
+
+    results = {}
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                backfill_month, url, taxi_type, year, month, target_table.format(taxi_type=taxi_type),
+                chunksize, load_method, connections_per_worker, queue_depth, index_columns, source_format,
+            ): (taxi_type, year, month)
+            for taxi_type, year, month in months
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                failures[key] = e
+                print(f'{key[0]} {key[1]}-{key[2]:02d} failed: {e}')
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        strays = []
+        for taxi_type, year, month in sorted(results):
+            staging_table = results[taxi_type, year, month][0]
+            table = target_table.format(taxi_type=taxi_type)
+            create_partitioned_table(conn, table, staging_table, taxi_type)
+            create_parent_indexes(conn, table, partition_index_columns(taxi_type, index_columns))
+            strays.append((table, swap_in_partition(conn, table, staging_table, taxi_type, year, month), taxi_type))
+        for table, strays_table, taxi_type in strays:
+            insert_strays(conn, table, strays_table, taxi_type)
+
+    print(f'\n{"month":<16}{"rows":>12}{"MiB":>10}{"seconds":>10}{"rows/s":>12}')
+    for taxi_type, year, month in months:
+        label = f'{taxi_type} {year}-{month:02d}'
+        if (taxi_type, year, month) in failures:
+            print(f'{label:<16}{"failed":>12}')
+            continue
+        _, rows, size, seconds = results[taxi_type, year, month]
+        mib = size / 1024 ** 2 if size else float('nan')
+        print(f'{label:<16}{rows:>12,}{mib:>10.1f}{seconds:>10.1f}{rows / seconds:>12,.0f}')
+
+    if failures:
+        raise click.ClickException(f'{len(failures)} month(s) failed and were not attached')
+
+
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    cli()
@@ -1,41 +1,125 @@
+import argparse
+import base64
+import hashlib
+import json
 import os
+import queue
 import sys
+import threading
 import urllib.request
 from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import google_crc32c
 from google.cloud import storage
 from google.api_core.exceptions import NotFound, Forbidden
 import time
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+from download_cache import fetch
+
 
 # Change this to your bucket name
 BUCKET_NAME = "njogu-dezoomcamp_hw3_2026" # Must be globally unique across GCS.
 
 # Because I set GOOGLE_APPLICATION_CREDENTIALS in bash, 
 # I don’t need to hardcode the JSON file anymore.
+# With STORAGE_EMULATOR_HOST set (e.g. http://localhost:4443 for
+# fake-gcs-server) it talks to that emulator without credentials instead.
 client = storage.Client() # will automatically use GOOGLE_APPLICATION_CREDENTIALS
 
 
 
-BASE_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_2024-"
-MONTHS = [f"{i:02d}" for i in range(1, 7)]
-DOWNLOAD_DIR = "."
+# TLC_BASE_URL points the downloads at another server, e.g. a local
+# `python -m http.server` with a few monthly files for testing
+BASE_URL = os.getenv("TLC_BASE_URL", "https://d37ci6vzurychx.cloudfront.net/trip-data")
+TAXI_TYPES = ["yellow", "green", "fhv", "fhvhv"]
 
-CHUNK_SIZE = 8 * 1024 * 1024
+# What was uploaded for each object, to skip unchanged months on later runs
+MANIFEST_PATH = Path(__file__).resolve().parent / "load_taxi_manifest.json"
 
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+# Must be a multiple of 256 KiB for resumable uploads
+CHUNK_SIZE = 8 * 1024 * 1024
+# Downloaded chunks that can wait for the upload in streaming mode
+STREAM_BUFFER_CHUNKS = 4
+# Files larger than one slice are uploaded as slices in parallel and
+# composed; a compose request takes at most 32 source objects
+SLICE_SIZE = 16 * 1024 * 1024
+MAX_COMPOSE_SOURCES = 32
 
 bucket = client.bucket(BUCKET_NAME)
 
 
-def download_file(month):
-    url = f"{BASE_URL}{month}.parquet"
-    file_path = os.path.join(DOWNLOAD_DIR, f"yellow_tripdata_2024-{month}.parquet")
+def month_range(start, end):
+    """YYYY-MM strings from start to end, inclusive."""
+    year, month = map(int, start.split("-"))
+    months = []
+    while f"{year}-{month:02d}" <= end:
+        months.append(f"{year}-{month:02d}")
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def source_info(url):
+    """Size, ETag and Last-Modified of url from a HEAD request, None if unavailable."""
+    request = urllib.request.Request(url, method="HEAD")
+    try:
+        response = urllib.request.urlopen(request, timeout=60)
+    except OSError as e:
+        print(f"Not available: {url} ({e})")
+        return None
+    with response:
+        return {
+            "size": int(response.headers.get("Content-Length", -1)),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+
+def list_objects(prefixes):
+    """name -> Blob for the objects under each prefix, one listing per prefix."""
+    return {blob.name: blob for prefix in prefixes for blob in client.list_blobs(bucket, prefix=prefix)}
+
 
+def manifest_entry(blob, source):
+    return {"size": blob.size, "crc32c": blob.crc32c, "generation": blob.generation, "source": source}
+
+
+def transfer_reason(blob_name, objects, manifest, source):
+    """Why blob_name has to be transferred, or None if it is up to date."""
+    blob = objects.get(blob_name)
+    entry = manifest.get(blob_name)
+    if blob is None:
+        return "missing"
+    if entry is None:
+        return "not in manifest"
+    if (blob.size, blob.crc32c, blob.generation) != (entry["size"], entry["crc32c"], entry["generation"]):
+        return "object changed since the last upload"
+    if source != entry["source"]:
+        return "source file changed"
+    return None
+
+
+def download_file(url, blob_name):
     try:
-        print(f"Downloading {url}...")
-        urllib.request.urlretrieve(url, file_path)
-        print(f"Downloaded: {file_path}")
-        return file_path
+        print(f"Fetching {url}...")
+        file_path = fetch(url)
+        print(f"Cached: {file_path}")
+        return str(file_path), blob_name
     except Exception as e:
         print(f"Failed to download {url}: {e}")
         return None
@@ -70,43 +154,274 @@ def create_bucket(bucket_name):
         sys.exit(1)
 
 
-def verify_gcs_upload(blob_name):
-    return storage.Blob(bucket=bucket, name=blob_name).exists(client)
+def crc32c_combine(crc1, crc2, length2):
+    """CRC32C of a + b from crc32c(a), crc32c(b) and len(b), as zlib's crc32_combine."""
+    def times(matrix, vector):
+        total, row = 0, 0
+        while vector:
+            if vector & 1:
+                total ^= matrix[row]
+            vector >>= 1
+            row += 1
+        return total
+
+    def square(matrix):
+        return [times(matrix, row) for row in matrix]
+
+    # Operator for one zero bit, squared to apply 2, 4, 8... zero bits
+    operator = [0x82F63B78] + [1 << i for i in range(31)]
+    operator = square(square(operator))
+    while length2:
+        operator = square(operator)
+        if length2 & 1:
+            crc1 = times(operator, crc1)
+        length2 >>= 1
+    return crc1 ^ crc2
+
+
+def checksums_match(blob, md5=None, crc32c=None):
+    """Compare the checksums GCS computed for blob with the local ones."""
+    if md5 is not None and blob.md5_hash != base64.b64encode(md5).decode():
+        return False
+    return crc32c is None or blob.crc32c == base64.b64encode(crc32c.to_bytes(4, "big")).decode()
 
 
-def upload_to_gcs(file_path, max_retries=3):
-    blob_name = os.path.basename(file_path)
+def plan_slices(size, slice_size=SLICE_SIZE):
+    """(offset, length) of each slice, larger slices if needed to stay within one compose."""
+    slice_size = max(slice_size, -(-size // MAX_COMPOSE_SOURCES))
+    slice_size = -(-slice_size // (256 * 1024)) * 256 * 1024
+    return [(offset, min(slice_size, size - offset)) for offset in range(0, size, slice_size)] or [(0, 0)]
+
+
+def upload_slice(file_path, blob_name, offset, length, max_retries=3):
+    """Upload length bytes of file_path at offset as blob_name.
+
+    The checksums are computed from the bytes as they are sent and checked
+    against the ones GCS returns. Returns (crc32c, started, finished).
+    """
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    md5 = hashlib.md5(data).digest()
+    crc32c = google_crc32c.value(data)
+
     blob = bucket.blob(blob_name)
     blob.chunk_size = CHUNK_SIZE
+    for attempt in range(max_retries):
+        try:
+            started = time.time()
+            blob.upload_from_string(data, content_type="application/octet-stream")
+            if checksums_match(blob, md5, crc32c):
+                return crc32c, started, time.time()
+            print(f"Checksum mismatch for {blob_name} (Attempt {attempt + 1}), retrying...")
+        except Exception as e:
+            print(f"Failed to upload {blob_name} (Attempt {attempt + 1}): {e}")
+        time.sleep(5)
+    raise IOError(f"Giving up on {blob_name} after {max_retries} attempts")
 
-    create_bucket(BUCKET_NAME)
 
+def submit_upload(executor, file_path, blob_name=None, slice_size=SLICE_SIZE, max_retries=3):
+    """Queue the slices of file_path on executor; finish_upload() puts them together."""
+    blob_name = blob_name or os.path.basename(file_path)
+    slices = plan_slices(os.path.getsize(file_path), slice_size)
+    print(f"Uploading {file_path} to {BUCKET_NAME} in {len(slices)} slice(s)...")
+    if len(slices) == 1:
+        names = [blob_name]
+    else:
+        names = [f"{blob_name}.part{index:02d}" for index in range(len(slices))]
+    futures = [
+        executor.submit(upload_slice, file_path, name, offset, length, max_retries)
+        for name, (offset, length) in zip(names, slices)
+    ]
+    return file_path, blob_name, slices, names, futures
+
+
+def finish_upload(file_path, blob_name, slices, names, futures):
+    """Wait for the slices of one file, compose them and verify the result.
+
+    Returns the uploaded blob, or None if the upload failed.
+    """
+    parts = [bucket.blob(name) for name in names]
+    try:
+        results = [future.result() for future in futures]
+
+        crc32c = results[0][0]
+        for (offset, length), (slice_crc32c, _, _) in zip(slices[1:], results[1:]):
+            crc32c = crc32c_combine(crc32c, slice_crc32c, length)
+
+        if len(parts) > 1:
+            composed = bucket.blob(blob_name)
+            composed.content_type = "application/octet-stream"
+            composed.compose(parts)
+        # Fresh metadata for either path: a single slice was uploaded through
+        # another Blob object, and the manifest needs the generation
+        blob = bucket.get_blob(blob_name)
+        # Composite objects have no MD5, so the whole file is checked by CRC32C
+        if blob is None or not checksums_match(blob, crc32c=crc32c):
+            print(f"Verification failed for {blob_name}: CRC32C differs from {file_path}")
+            return None
+
+        size = sum(length for _, length in slices)
+        elapsed = time.time() - min(started for _, started, _ in results)
+        print(f"Uploaded: gs://{BUCKET_NAME}/{blob_name} ({size / 1024 ** 2:.1f} MiB in {len(slices)} slice(s), "
+              f"{size / 1024 ** 2 / elapsed:.1f} MiB/s), CRC32C verified")
+        return blob
+    except Exception as e:
+        print(f"Failed to upload {file_path} to GCS: {e}")
+        return None
+    finally:
+        if len(parts) > 1:
+            for part in parts:
+                try:
+                    part.delete()
+                except NotFound:
+                    pass
+
+
+def read_chunks(response, chunks, stop):
+    """Download thread of stream_file(): put the body on chunks, then b''."""
+    try:
+        while not stop.is_set():
+            chunk = response.read(CHUNK_SIZE)
+            chunks.put(chunk)
+            if not chunk:
+                return
+    except Exception as e:
+        chunks.put(e)
+
+
+def stream_file(url, blob):
+    """Copy url into blob with a resumable upload, without a local file.
+
+    A thread downloads the next chunks while the current one is uploaded.
+    A failed or short download cancels the upload session, so no partial
+    object is left in the bucket. Returns the number of bytes uploaded and
+    their MD5 and CRC32C.
+    """
+    chunks = queue.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+    stop = threading.Event()
+    size = 0
+    md5 = hashlib.md5()
+    crc32c = google_crc32c.Checksum()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        expected_size = response.headers.get("Content-Length")
+        reader = threading.Thread(target=read_chunks, args=(response, chunks, stop), daemon=True)
+        reader.start()
+        try:
+            with blob.open("wb", chunk_size=CHUNK_SIZE, content_type="application/octet-stream") as gcs_file:
+                while True:
+                    chunk = chunks.get()
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    if not chunk:
+                        break
+                    gcs_file.write(chunk)
+                    md5.update(chunk)
+                    crc32c.update(chunk)
+                    size += len(chunk)
+                if expected_size is not None and size != int(expected_size):
+                    raise IOError(f"Download ended after {size} of {expected_size} bytes")
+        finally:
+            # Unblock the download thread if the upload failed
+            stop.set()
+            while reader.is_alive():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+    return size, md5.digest(), int.from_bytes(crc32c.digest(), "big")
+
+
+def stream_to_gcs(url, blob_name, max_retries=3):
     for attempt in range(max_retries):
         try:
-            print(f"Uploading {file_path} to {BUCKET_NAME} (Attempt {attempt + 1})...")
-            blob.upload_from_filename(file_path)
-            print(f"Uploaded: gs://{BUCKET_NAME}/{blob_name}")
+            print(f"Streaming {url} to gs://{BUCKET_NAME}/{blob_name} (Attempt {attempt + 1})...")
+            start = time.time()
+            size, md5, crc32c = stream_file(url, bucket.blob(blob_name))
+            elapsed = time.time() - start
+            print(f"Uploaded: gs://{BUCKET_NAME}/{blob_name} ({size / 1024 ** 2:.1f} MiB, "
+                  f"{size / 1024 ** 2 / elapsed:.1f} MiB/s)")
 
-            if verify_gcs_upload(blob_name):
+            blob = bucket.get_blob(blob_name)
+            if blob is not None and blob.size == size and checksums_match(blob, md5, crc32c):
                 print(f"Verification successful for {blob_name}")
-                return
-            else:
-                print(f"Verification failed for {blob_name}, retrying...")
+                return blob
+            print(f"Verification failed for {blob_name}, retrying...")
         except Exception as e:
-            print(f"Failed to upload {file_path} to GCS: {e}")
+            print(f"Failed to stream {url} to GCS: {e}")
 
         time.sleep(5)
 
-    print(f"Giving up on {file_path} after {max_retries} attempts.")
+    print(f"Giving up on {url} after {max_retries} attempts.")
+    return None
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load TLC trip data months into GCS, skipping the ones already there and unchanged")
+    parser.add_argument("--taxi-types", nargs="+", choices=TAXI_TYPES, default=["yellow"])
+    parser.add_argument("--start", default="2024-01", help="first month, YYYY-MM")
+    parser.add_argument("--end", default="2024-06", help="last month, YYYY-MM")
+    parser.add_argument("--manifest", default=MANIFEST_PATH,
+                        help="JSON file with the size, crc32c and generation of each uploaded object")
+    parser.add_argument("--force", action="store_true", help="transfer every month, even if unchanged")
+    parser.add_argument("--stream", action="store_true",
+                        help="pipe each download straight into a resumable upload instead of "
+                             "downloading every month to disk first")
+    parser.add_argument("--max-workers", type=int, default=8,
+                        help="concurrent uploads, shared by all months and their slices")
+    parser.add_argument("--slice-size", type=int, default=SLICE_SIZE // 1024 ** 2,
+                        help="MiB per parallel slice of a file; larger files are composed from slices")
+    args = parser.parse_args()
+
     create_bucket(BUCKET_NAME)
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        file_paths = list(executor.map(download_file, MONTHS))
+    manifest = load_manifest(args.manifest)
+    objects = list_objects(f"{taxi_type}_tripdata_" for taxi_type in args.taxi_types)
+    candidates = [
+        (f"{BASE_URL}/{taxi_type}_tripdata_{month}.parquet", f"{taxi_type}_tripdata_{month}.parquet")
+        for taxi_type in args.taxi_types
+        for month in month_range(args.start, args.end)
+    ]
+
+    # A HEAD per month tells whether TLC has republished it since the last run
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        sources = list(executor.map(lambda candidate: source_info(candidate[0]), candidates))
+
+    targets = []
+    for (url, blob_name), source in zip(candidates, sources):
+        if source is None:
+            continue
+        reason = "forced" if args.force else transfer_reason(blob_name, objects, manifest, source)
+        if reason is None:
+            print(f"Up to date: gs://{BUCKET_NAME}/{blob_name}")
+        else:
+            print(f"To transfer: {blob_name} ({reason})")
+            targets.append((url, blob_name, source))
+    print(f"{len(targets)} of {len(candidates)} files to transfer")
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        executor.map(upload_to_gcs, filter(None, file_paths))  # Remove None values
+    if args.stream:
+        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+            blobs = list(executor.map(lambda target: stream_to_gcs(*target[:2]), targets))
+    else:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            downloads = list(executor.map(lambda target: download_file(*target[:2]), targets))
 
+        # All slices of all months share one pool; each file is composed as
+        # soon as its own slices are in
+        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+            uploads = [
+                submit_upload(executor, download[0], download[1], args.slice_size * 1024 ** 2)
+                if download else None
+                for download in downloads
+            ]
+            blobs = [finish_upload(*upload) if upload else None for upload in uploads]
+
+    for (url, blob_name, source), blob in zip(targets, blobs):
+        if blob is not None:
+            manifest[blob_name] = manifest_entry(blob, source)
+    save_manifest(args.manifest, manifest)
+
+    if not all(blobs):
+        sys.exit(1)
     print("All files processed and verified.")
@@ -0,0 +1,97 @@
+"""Checks for the sliced uploads of load_taxi.py against an in-memory bucket.
+
+    uv run pytest 03.data-warehouse/test_load_taxi.py
+"""
+import base64
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import google_crc32c
+import pytest
+
+# No credentials needed: the client is created at import but never used
+os.environ.setdefault("STORAGE_EMULATOR_HOST", "http://localhost:4443")
+import load_taxi
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.chunk_size = None
+        self.md5_hash = self.crc32c = self.generation = self.size = None
+
+    def _set_properties(self, data, composite=False):
+        self.size = len(data)
+        self.generation = self.bucket.generation
+        self.crc32c = base64.b64encode(google_crc32c.Checksum(data).digest()).decode()
+        # Like GCS, composite objects have no MD5
+        self.md5_hash = None if composite else base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.store(self.name, data, composite=False)
+        self._set_properties(data)
+
+    def compose(self, sources):
+        data = b"".join(self.bucket.objects[source.name][0] for source in sources)
+        self.bucket.store(self.name, data, composite=True)
+        self._set_properties(data, composite=True)
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.generation = 0
+
+    def store(self, name, data, composite):
+        self.generation += 1
+        self.objects[name] = (data, composite)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        if name not in self.objects:
+            return None
+        data, composite = self.objects[name]
+        blob = FakeBlob(self, name)
+        blob._set_properties(data, composite)
+        return blob
+
+
+@pytest.fixture
+def fake_bucket(monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(load_taxi, "bucket", bucket)
+    return bucket
+
+
+def upload(path, slice_size):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return load_taxi.finish_upload(*load_taxi.submit_upload(executor, str(path), "trips.parquet", slice_size))
+
+
+@pytest.mark.parametrize("size", [0, 1000, 256 * 1024, 256 * 1024 + 1, 3 * 256 * 1024 + 5])
+def test_upload_verifies_single_and_composed_files(tmp_path, fake_bucket, size):
+    data = os.urandom(size)
+    path = tmp_path / "trips.parquet"
+    path.write_bytes(data)
+
+    blob = upload(path, slice_size=256 * 1024)
+
+    assert blob is not None
+    assert blob.generation is not None
+    assert fake_bucket.objects["trips.parquet"][0] == data
+    # Only the final object is left
+    assert list(fake_bucket.objects) == ["trips.parquet"]
+
+
+def test_crc32c_combine():
+    first, second = os.urandom(1000), os.urandom(77777)
+    combined = load_taxi.crc32c_combine(google_crc32c.value(first), google_crc32c.value(second), len(second))
+    assert combined == google_crc32c.value(first + second)
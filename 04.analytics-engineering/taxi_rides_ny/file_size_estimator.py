@@ -1,26 +1,37 @@
 import requests, sys
+from concurrent.futures import ThreadPoolExecutor
 BASE_URL = "https://github.com/DataTalksClub/nyc-tlc-data/releases/download"
-total = 0
-missing = []
-for taxi in ("yellow","green"):
-    for year in (2019,2020):
-        for month in range(1,13):
-            fname = f"{taxi}_tripdata_{year}-{month:02d}.csv.gz"
-            url = f"{BASE_URL}/{taxi}/{fname}"
-            try:
-                r = requests.head(url, allow_redirects=True, timeout=10)
-                size = r.headers.get("Content-Length")
-                if size:
-                    total += int(size)
-                else:
-                    missing.append(fname)
-            except Exception as e:
-                missing.append(fname)
-print("Estimated bytes:", total)
-print("Estimated GB: {:.2f}".format(total/1024**3))
-print("Missing Content-Length for files:", missing)
-# show available space
-import shutil
-total_b, used_b, free_b = shutil.disk_usage("/workspaces")
-print("Available bytes on /workspaces:", free_b)
-print("Available GB:", free_b/1024**3)
+
+def content_length(url):
+    """Content-Length of url from a HEAD request, or None if unavailable."""
+    try:
+        r = requests.head(url, allow_redirects=True, timeout=10)
+        size = r.headers.get("Content-Length")
+        return int(size) if size else None
+    except Exception:
+        return None
+
+def estimate_sizes(taxi_types=("yellow", "green"), years=(2019, 2020), workers=8):
+    """Map each CSV.gz file name to its Content-Length (None when missing)."""
+    files = {}
+    for taxi in taxi_types:
+        for year in years:
+            for month in range(1,13):
+                fname = f"{taxi}_tripdata_{year}-{month:02d}.csv.gz"
+                files[fname] = f"{BASE_URL}/{taxi}/{fname}"
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sizes = pool.map(content_length, files.values())
+    return dict(zip(files, sizes))
+
+if __name__ == "__main__":
+    sizes = estimate_sizes()
+    total = sum(size for size in sizes.values() if size)
+    missing = [fname for fname, size in sizes.items() if size is None]
+    print("Estimated bytes:", total)
+    print("Estimated GB: {:.2f}".format(total/1024**3))
+    print("Missing Content-Length for files:", missing)
+    # show available space
+    import shutil
+    total_b, used_b, free_b = shutil.disk_usage("/workspaces")
+    print("Available bytes on /workspaces:", free_b)
+    print("Available GB:", free_b/1024**3)
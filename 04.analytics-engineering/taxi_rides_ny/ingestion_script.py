@@ -1,5 +1,10 @@
+import argparse
+import os
+import sys
+import time
 import duckdb
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
 BASE_URL = "https://github.com/DataTalksClub/nyc-tlc-data/releases/download"
@@ -11,11 +16,90 @@ DB_PATH     = PROJECT_DIR / "taxi_rides_ny.duckdb"
 
 DATA_ROOT.mkdir(parents=True, exist_ok=True)
 
-def download_and_convert_files(taxi_type: str):
+sys.path.insert(0, str(PROJECT_DIR.parent.parent / "common"))
+from download_cache import DownloadCache, fetch
+from file_size_estimator import estimate_sizes
+
+YEARS = [2019, 2020]
+
+# Column layout of the 2019-2020 CSV files. Declaring it avoids sniffing every
+# file and gives all months identical Parquet schemas.
+TRIP_COLUMNS = {
+    "yellow": {
+        "VendorID": "BIGINT",
+        "tpep_pickup_datetime": "TIMESTAMP",
+        "tpep_dropoff_datetime": "TIMESTAMP",
+        "passenger_count": "BIGINT",
+        "trip_distance": "DOUBLE",
+        "RatecodeID": "BIGINT",
+        "store_and_fwd_flag": "VARCHAR",
+        "PULocationID": "BIGINT",
+        "DOLocationID": "BIGINT",
+        "payment_type": "BIGINT",
+        "fare_amount": "DOUBLE",
+        "extra": "DOUBLE",
+        "mta_tax": "DOUBLE",
+        "tip_amount": "DOUBLE",
+        "tolls_amount": "DOUBLE",
+        "improvement_surcharge": "DOUBLE",
+        "total_amount": "DOUBLE",
+        "congestion_surcharge": "DOUBLE",
+    },
+    "green": {
+        "VendorID": "BIGINT",
+        "lpep_pickup_datetime": "TIMESTAMP",
+        "lpep_dropoff_datetime": "TIMESTAMP",
+        "store_and_fwd_flag": "VARCHAR",
+        "RatecodeID": "BIGINT",
+        "PULocationID": "BIGINT",
+        "DOLocationID": "BIGINT",
+        "passenger_count": "BIGINT",
+        "trip_distance": "DOUBLE",
+        "fare_amount": "DOUBLE",
+        "extra": "DOUBLE",
+        "mta_tax": "DOUBLE",
+        "tip_amount": "DOUBLE",
+        "tolls_amount": "DOUBLE",
+        "ehail_fee": "DOUBLE",
+        "improvement_surcharge": "DOUBLE",
+        "total_amount": "DOUBLE",
+        "payment_type": "BIGINT",
+        "trip_type": "BIGINT",
+        "congestion_surcharge": "DOUBLE",
+    },
+}
+
+PICKUP_COLUMN = {
+    "yellow": "tpep_pickup_datetime",
+    "green": "lpep_pickup_datetime",
+}
+
+def conversion_connection(threads, memory_limit):
+    # One in-memory DuckDB instance for all conversions, so concurrent months
+    # share its thread pool and memory limit instead of each claiming all cores
+    return duckdb.connect(config={"threads": threads, "memory_limit": memory_limit})
+
+def convert_to_parquet(con, taxi_type, csv_gz_filepath, parquet_filepath,
+                       row_group_size=122880, compression="zstd"):
+    # Write to a temporary name first so an interrupted run never leaves a
+    # half-written file that the next run would skip
+    tmp_filepath = parquet_filepath.with_suffix(".parquet.tmp")
+    cursor = con.cursor()  # a connection must not be shared between threads
+    cursor.execute(f"""
+        COPY (
+            SELECT * FROM read_csv('{csv_gz_filepath}', header=true, auto_detect=false,
+                                   delim=',', quote='"', columns={TRIP_COLUMNS[taxi_type]})
+        )
+        TO '{tmp_filepath}' (FORMAT PARQUET, COMPRESSION {compression}, ROW_GROUP_SIZE {row_group_size})
+    """)
+    cursor.close()
+    tmp_filepath.replace(parquet_filepath)
+
+def download_and_convert_files(taxi_type: str, convert):
     data_dir = DATA_ROOT / taxi_type
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    for year in [2019, 2020]:
+    for year in YEARS:
         for month in range(1, 13):
             parquet_filename = f"{taxi_type}_tripdata_{year}-{month:02d}.parquet"
             parquet_filepath = data_dir / parquet_filename
@@ -24,31 +108,96 @@ def download_and_convert_files(taxi_type: str):
                 print(f"Skipping {parquet_filename} (already exists)")
                 continue
 
-            # Download CSV.gz
+            # Download CSV.gz (or reuse the cached copy). It stays in the
+            # shared download cache, which evicts it, instead of being deleted
             csv_gz_filename = f"{taxi_type}_tripdata_{year}-{month:02d}.csv.gz"
-            csv_gz_filepath = data_dir / csv_gz_filename
 
             url = f"{BASE_URL}/{taxi_type}/{csv_gz_filename}"
-            print(f"Downloading {csv_gz_filename} ...")
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-
-            with open(csv_gz_filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            print(f"Fetching {csv_gz_filename} ...")
+            csv_gz_filepath = fetch(url)
 
             print(f"Converting {csv_gz_filename} to Parquet...")
-            con = duckdb.connect()
-            con.execute(f"""
-                COPY (SELECT * FROM read_csv_auto('{csv_gz_filepath}'))
-                TO '{parquet_filepath}' (FORMAT PARQUET)
-            """)
-            con.close()
-
-            # Clean up csv.gz
-            csv_gz_filepath.unlink(missing_ok=True)
+            convert(taxi_type, csv_gz_filepath, parquet_filepath)
+
             print(f"Completed {parquet_filename}\n")
 
+def download_with_retries(cache, url, expected_size, retries):
+    # Every retry resumes the partial file with an HTTP Range request
+    for attempt in range(1, retries + 1):
+        try:
+            return cache.fetch(url, expected_size=expected_size)
+        except OSError as e:
+            if attempt == retries:
+                raise
+            print(f"Download of {url} failed ({e}), resuming (attempt {attempt + 1}/{retries})")
+            time.sleep(2 ** attempt)
+
+def download_and_convert_concurrently(taxi_types, convert, download_workers, convert_workers,
+                                      buffer_size, retries):
+    """Download all months with a bounded pool and convert each file as soon as it lands.
+
+    Sizes are verified against the HEAD Content-Length from file_size_estimator.py.
+    """
+    cache = DownloadCache(chunk_size=buffer_size)
+    pending = []
+    for taxi_type in taxi_types:
+        data_dir = DATA_ROOT / taxi_type
+        data_dir.mkdir(parents=True, exist_ok=True)
+        for year in YEARS:
+            for month in range(1, 13):
+                parquet_filepath = data_dir / f"{taxi_type}_tripdata_{year}-{month:02d}.parquet"
+                if parquet_filepath.exists():
+                    print(f"Skipping {parquet_filepath.name} (already exists)")
+                    continue
+                pending.append((taxi_type, f"{taxi_type}_tripdata_{year}-{month:02d}.csv.gz", parquet_filepath))
+
+    if not pending:
+        return
+
+    print(f"Checking sizes of {len(pending)} files...")
+    sizes = estimate_sizes(taxi_types, YEARS, workers=download_workers)
+
+    start = time.time()
+    downloaded = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+         ThreadPoolExecutor(max_workers=convert_workers) as conversions:
+        download_futures = {}
+        for taxi_type, csv_gz_filename, parquet_filepath in pending:
+            url = f"{BASE_URL}/{taxi_type}/{csv_gz_filename}"
+            future = downloads.submit(download_with_retries, cache, url, sizes.get(csv_gz_filename), retries)
+            download_futures[future] = (taxi_type, csv_gz_filename, parquet_filepath)
+
+        # Conversions start as soon as each download finishes, while the
+        # remaining downloads are still running
+        convert_futures = {}
+        for future in as_completed(download_futures):
+            taxi_type, csv_gz_filename, parquet_filepath = download_futures[future]
+            try:
+                csv_gz_filepath = future.result()
+            except Exception as e:
+                print(f"Failed to download {csv_gz_filename}: {e}")
+                failed.append(csv_gz_filename)
+                continue
+            downloaded += csv_gz_filepath.stat().st_size
+            print(f"Downloaded {csv_gz_filename}, converting to Parquet...")
+            convert_futures[conversions.submit(convert, taxi_type, csv_gz_filepath, parquet_filepath)] = csv_gz_filename
+
+        for future in as_completed(convert_futures):
+            csv_gz_filename = convert_futures[future]
+            try:
+                future.result()
+                print(f"Completed {csv_gz_filename}")
+            except Exception as e:
+                print(f"Failed to convert {csv_gz_filename}: {e}")
+                failed.append(csv_gz_filename)
+
+    elapsed = time.time() - start
+    print(f"\nFetched {downloaded / 1024**3:.2f} GB and converted {len(pending) - len(failed)} files "
+          f"in {elapsed:.0f}s")
+    if failed:
+        sys.exit(f"Failed files (rerun to resume): {', '.join(sorted(failed))}")
+
 def update_gitignore():
     gitignore_path = PROJECT_DIR / ".gitignore"
     content = gitignore_path.read_text() if gitignore_path.exists() else ""
@@ -59,12 +208,139 @@ def update_gitignore():
                 f.write('\n')
             f.write('# Data directory\ndata/\n')
 
+def month_bounds(file_name):
+    """First day of the month of <taxi_type>_tripdata_<year>-<month>.parquet and of the next one."""
+    year, month = map(int, Path(file_name).stem.rsplit("_", 1)[1].split("-"))
+    return f"{year}-{month:02d}-01", f"{year + month // 12}-{month % 12 + 1:02d}-01"
+
+def rebuild(con, taxi_type):
+    """Recreate the table from every Parquet file, keeping only the rows of each
+    file's own month, as load_incrementally does."""
+    table = f"prod.{taxi_type}_tripdata"
+    pickup = PICKUP_COLUMN[taxi_type]
+    pattern = f"data/{taxi_type}/*.parquet"
+    print(f"Creating table {table} from: {pattern}")
+
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * EXCLUDE (filename, month_start) FROM (
+            SELECT *, strptime(regexp_extract(filename, '_(\\d{{4}}-\\d{{2}})\\.parquet$', 1), '%Y-%m')
+                AS month_start
+            FROM read_parquet('{pattern}', union_by_name=true, filename=true)
+        )
+        WHERE {pickup} >= month_start AND {pickup} < month_start + INTERVAL 1 MONTH
+    """)
+
+def load_incrementally(con, taxi_type):
+    """Load only the months whose Parquet file is new or changed since the last run.
+
+    prod.load_manifest records the size and mtime of every loaded file. A
+    changed month is replaced by deleting its pickup-month range and inserting
+    the file again, so only rows of that month are kept from each file, as in
+    a rebuild. The month of a file that is gone is deleted with its manifest row.
+    """
+    table = f"prod.{taxi_type}_tripdata"
+    pickup = PICKUP_COLUMN[taxi_type]
+    columns = ", ".join(f"{name} {type_}" for name, type_ in TRIP_COLUMNS[taxi_type].items())
+    con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS prod.load_manifest (
+            taxi_type VARCHAR,
+            file_name VARCHAR,
+            size BIGINT,
+            mtime DOUBLE,
+            row_count BIGINT,
+            loaded_at TIMESTAMP,
+            PRIMARY KEY (taxi_type, file_name)
+        )
+    """)
+    loaded = {
+        file_name: (size, mtime)
+        for file_name, size, mtime in con.execute(
+            "SELECT file_name, size, mtime FROM prod.load_manifest WHERE taxi_type = ?", [taxi_type]
+        ).fetchall()
+    }
+
+    parquet_filepaths = sorted((DATA_ROOT / taxi_type).glob("*.parquet"))
+    present = {parquet_filepath.name for parquet_filepath in parquet_filepaths}
+    for file_name in sorted(set(loaded) - present):
+        month_start, month_end = month_bounds(file_name)
+        con.begin()
+        con.execute(f"DELETE FROM {table} WHERE {pickup} >= ? AND {pickup} < ?", [month_start, month_end])
+        con.execute("DELETE FROM prod.load_manifest WHERE taxi_type = ? AND file_name = ?", [taxi_type, file_name])
+        con.commit()
+        print(f"Removed {file_name}: the file is gone")
+
+    unchanged = 0
+    for parquet_filepath in parquet_filepaths:
+        stat = parquet_filepath.stat()
+        if loaded.get(parquet_filepath.name) == (stat.st_size, stat.st_mtime):
+            unchanged += 1
+            continue
+
+        month_start, month_end = month_bounds(parquet_filepath.name)
+
+        start = time.time()
+        con.begin()
+        con.execute(f"DELETE FROM {table} WHERE {pickup} >= ? AND {pickup} < ?", [month_start, month_end])
+        con.execute(f"""
+            INSERT INTO {table}
+            SELECT * FROM read_parquet('{parquet_filepath}')
+            WHERE {pickup} >= ? AND {pickup} < ?
+        """, [month_start, month_end])
+        row_count = con.execute(
+            f"SELECT count(*) FROM {table} WHERE {pickup} >= ? AND {pickup} < ?", [month_start, month_end]
+        ).fetchone()[0]
+        con.execute("""
+            INSERT OR REPLACE INTO prod.load_manifest VALUES (?, ?, ?, ?, ?, current_timestamp)
+        """, [taxi_type, parquet_filepath.name, stat.st_size, stat.st_mtime, row_count])
+        con.commit()
+        print(f"Loaded {parquet_filepath.name}: {row_count} rows in {time.time() - start:.1f}s")
+
+    print(f"{table}: {unchanged} months unchanged")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download NYC taxi data and load it into DuckDB",
+        epilog="The CSV downloads are not deleted after conversion: they stay in the download cache "
+               "shared with the other course scripts (TLC_CACHE_DIR, default ~/.cache/nyc-tlc), which "
+               "evicts the least recently used files above TLC_CACHE_MAX_BYTES (default 50 GB).",
+    )
+    parser.add_argument("--download-workers", type=int, default=4,
+                        help="parallel downloads, with conversions overlapping them; "
+                             "1 downloads and converts one month at a time")
+    parser.add_argument("--convert-workers", type=int, default=2,
+                        help="months converted at once while downloading")
+    parser.add_argument("--buffer-mib", type=int, default=8,
+                        help="download buffer size in MiB with several download workers")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="download attempts per file, each resuming where the last one stopped")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="DuckDB threads shared by all conversions")
+    parser.add_argument("--memory-limit", default="4GB",
+                        help="DuckDB memory limit shared by all conversions")
+    parser.add_argument("--row-group-size", type=int, default=122880,
+                        help="rows per Parquet row group")
+    parser.add_argument("--compression", default="zstd", choices=["zstd", "snappy", "gzip", "uncompressed"],
+                        help="Parquet compression codec")
+    parser.add_argument("--incremental", action="store_true",
+                        help="insert only new or changed months instead of rebuilding the tables")
+    args = parser.parse_args()
+
     print("Starting NYC Taxi data ingestion...\n")
     update_gitignore()
 
-    for taxi_type in ["yellow", "green"]:
-        download_and_convert_files(taxi_type)
+    conversion_con = conversion_connection(args.threads, args.memory_limit)
+    convert = partial(convert_to_parquet, conversion_con,
+                      row_group_size=args.row_group_size, compression=args.compression)
+
+    if args.download_workers > 1:
+        download_and_convert_concurrently(["yellow", "green"], convert, args.download_workers,
+                                          args.convert_workers, args.buffer_mib * 1024 * 1024, args.retries)
+    else:
+        for taxi_type in ["yellow", "green"]:
+            download_and_convert_files(taxi_type, convert)
+    conversion_con.close()
 
     print("All downloads & conversions finished. Now loading into DuckDB...\n")
 
@@ -72,13 +348,10 @@ if __name__ == "__main__":
     con.execute("CREATE SCHEMA IF NOT EXISTS prod")
 
     for taxi_type in ["yellow", "green"]:
-        pattern = f"data/{taxi_type}/*.parquet"
-        print(f"Creating table prod.{taxi_type}_tripdata from: {pattern}")
-
-        con.execute(f"""
-            CREATE OR REPLACE TABLE prod.{taxi_type}_tripdata AS
-            SELECT * FROM read_parquet('{pattern}', union_by_name=true)
-        """)
+        if args.incremental:
+            load_incrementally(con, taxi_type)
+        else:
+            rebuild(con, taxi_type)
 
     con.close()
     print(f"Done! DuckDB database created at: {DB_PATH}")
\ No newline at end of file
@@ -2,38 +2,187 @@
 # coding: utf-8
 
 import argparse
+import json
+import urllib.request
+from datetime import datetime
 
 import pyspark
 from pyspark.sql import SparkSession
 from pyspark.sql import functions as F
 
 
+# Partition columns of the Parquet outputs
+PARTITION_COLUMNS = ['revenue_month', 'service_type']
+
+# Columns the revenue report reads; with --tuned only these are scanned
+REVENUE_COLUMNS = [
+    'PULocationID',
+    'pickup_datetime',
+    'passenger_count',
+    'trip_distance',
+    'fare_amount',
+    'extra',
+    'mta_tax',
+    'tip_amount',
+    'tolls_amount',
+    'improvement_surcharge',
+    'total_amount',
+    'congestion_surcharge',
+]
+
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument('--input_green', required=True)
 parser.add_argument('--input_yellow', required=True)
-parser.add_argument('--output', required=True)
+parser.add_argument('--output', help='BigQuery table for the revenue report')
+parser.add_argument('--output_parquet',
+                    help='write the revenue report here as Parquet, partitioned by revenue_month/service_type')
+parser.add_argument('--output_trips',
+                    help='also write the unified trips_data here as Parquet, partitioned the same way')
+parser.add_argument('--master', help='e.g. local[*] to run on a laptop; default: from spark-submit')
+parser.add_argument('--files_per_partition', type=int, default=1,
+                    help='Parquet files per revenue_month/service_type directory (0: one per task)')
+parser.add_argument('--max_records_per_file', type=int, default=0,
+                    help='split Parquet files above this many rows (0: no limit)')
+parser.add_argument('--row_group_mb', type=int, default=128,
+                    help='Parquet row group size in MiB')
+parser.add_argument('--tuned', action='store_true',
+                    help='adaptive query execution and only the columns the report needs')
+parser.add_argument('--advisory_partition_mb', type=int, default=64,
+                    help='with --tuned, target size AQE coalesces shuffle partitions to')
+parser.add_argument('--preaggregate', action='store_true',
+                    help='aggregate each service type on its own instead of the union of both')
+parser.add_argument('--start_month',
+                    help='first pickup month to read and write, YYYY-MM (required for the Parquet outputs)')
+parser.add_argument('--end_month',
+                    help='last pickup month to read and write, YYYY-MM (required for the Parquet outputs)')
+parser.add_argument('--explain', action='store_true',
+                    help='print the physical plan, and the stage metrics after the job')
 
 args = parser.parse_args()
 
+if not (args.output or args.output_parquet):
+    parser.error('give --output (BigQuery) and/or --output_parquet')
+
+# The TLC files carry a few pickups from other months (even 2009), which
+# would replace those months' partitions, so the Parquet sinks only write
+# the months the run is meant for
+if (args.output_parquet or args.output_trips) and not (args.start_month and args.end_month):
+    parser.error('--output_parquet/--output_trips need --start_month and --end_month, '
+                 'the months whose partitions are replaced')
+
 input_green = args.input_green
 input_yellow = args.input_yellow
 output = args.output
 
 
-spark = SparkSession.builder \
-    .appName('test') \
-    .getOrCreate()
+builder = SparkSession.builder \
+    .appName('test')
+
+if args.master:
+    builder = builder.master(args.master)
+
+spark = builder.getOrCreate()
+
+if args.tuned:
+    # Shuffle partitions are sized from the map output at runtime instead of
+    # spark.sql.shuffle.partitions, and skewed join partitions are split
+    spark.conf.set('spark.sql.adaptive.enabled', 'true')
+    spark.conf.set('spark.sql.adaptive.coalescePartitions.enabled', 'true')
+    spark.conf.set('spark.sql.adaptive.advisoryPartitionSizeInBytes', f'{args.advisory_partition_mb}m')
+    spark.conf.set('spark.sql.adaptive.skewJoin.enabled', 'true')
 
 spark.conf.set('temporaryGcsBucket', 'dataproc-temp-europe-west6-828225226997-fckhkym8')
 
-df_green = spark.read.parquet(input_green)
+# Overwrite only the revenue_month/service_type partitions present in the
+# data, so rerunning one month leaves the other months' files alone
+spark.conf.set('spark.sql.sources.partitionOverwriteMode', 'dynamic')
+
+
+def month_bounds():
+    """First day of --start_month and of the month after --end_month, None if not given."""
+    start = end = None
+    if args.start_month:
+        start = datetime.strptime(args.start_month, '%Y-%m')
+    if args.end_month:
+        end = datetime.strptime(args.end_month, '%Y-%m')
+        end = end.replace(year=end.year + end.month // 12, month=end.month % 12 + 1)
+    return start, end
+
+
+def write_parquet(df, path):
+    """Write the revenue_month partitions of --start_month..--end_month of df to path.
+
+    Rows of other months are dropped, so they never overwrite partitions
+    this run is not about.
+    """
+    start, end = month_bounds()
+    df = df.filter((F.col('revenue_month') >= F.lit(start.date())) & (F.col('revenue_month') < F.lit(end.date())))
+
+    if args.files_per_partition:
+        # Rows of a partition go to files_per_partition tasks, each writing
+        # one file; the hash keeps reruns deterministic
+        bucket = F.pmod(F.hash(*df.columns), F.lit(args.files_per_partition))
+        df = df.repartition(*PARTITION_COLUMNS, bucket)
+
+    df.write \
+        .mode('overwrite') \
+        .partitionBy(*PARTITION_COLUMNS) \
+        .option('maxRecordsPerFile', args.max_records_per_file) \
+        .option('parquet.block.size', args.row_group_mb * 1024 * 1024) \
+        .parquet(path)
+
+
+def read_trips(path, pickup_column):
+    """Read the Parquet trips at path, only the pickup months in --start_month..--end_month.
+
+    The comparisons on the pickup column are pushed into the Parquet scan,
+    which skips the row groups outside the range.
+    """
+    df = spark.read.parquet(path)
+    # Bounds of the column's own type (TIMESTAMP or TIMESTAMP_NTZ), so
+    # the filter is pushed down without a cast of the column
+    pickup_type = df.schema[pickup_column].dataType
+    start, end = month_bounds()
+    if start:
+        df = df.filter(F.col(pickup_column) >= F.lit(str(start)).cast(pickup_type))
+    if end:
+        df = df.filter(F.col(pickup_column) < F.lit(str(end)).cast(pickup_type))
+    return df
+
+
+def print_stage_metrics():
+    """Print the input and shuffle bytes of every completed stage from the Spark UI REST API."""
+    ui_url = spark.sparkContext.uiWebUrl
+    if ui_url is None:
+        print('The Spark UI is disabled, no stage metrics')
+        return
+    url = f'{ui_url}/api/v1/applications/{spark.sparkContext.applicationId}/stages?status=complete'
+    with urllib.request.urlopen(url) as response:
+        stages = sorted(json.load(response), key=lambda stage: stage['stageId'])
+
+    mib = 1024 * 1024
+    print(f"{'stage':>5} {'tasks':>6} {'input MiB':>10} {'shuffle write MiB':>18} "
+          f"{'shuffle read MiB':>17} {'run time s':>11}  name")
+    for stage in stages:
+        print(f"{stage['stageId']:>5} {stage['numTasks']:>6} {stage['inputBytes'] / mib:>10.1f} "
+              f"{stage['shuffleWriteBytes'] / mib:>18.1f} {stage['shuffleReadBytes'] / mib:>17.1f} "
+              f"{stage['executorRunTime'] / 1000:>11.1f}  {stage['name']}")
+    print(f"{'total':>5} {sum(stage['numTasks'] for stage in stages):>6} "
+          f"{sum(stage['inputBytes'] for stage in stages) / mib:>10.1f} "
+          f"{sum(stage['shuffleWriteBytes'] for stage in stages) / mib:>18.1f} "
+          f"{sum(stage['shuffleReadBytes'] for stage in stages) / mib:>17.1f} "
+          f"{sum(stage['executorRunTime'] for stage in stages) / 1000:>11.1f}")
+
+
+df_green = read_trips(input_green, 'lpep_pickup_datetime')
 
 df_green = df_green \
     .withColumnRenamed('lpep_pickup_datetime', 'pickup_datetime') \
     .withColumnRenamed('lpep_dropoff_datetime', 'dropoff_datetime')
 
-df_yellow = spark.read.parquet(input_yellow)
+df_yellow = read_trips(input_yellow, 'tpep_pickup_datetime')
 
 
 df_yellow = df_yellow \
@@ -64,21 +213,29 @@ common_columns = [
 
 
 
+# The trips output needs every common column, the report only some
+if args.tuned and not args.output_trips:
+    selected_columns = REVENUE_COLUMNS
+else:
+    selected_columns = common_columns
+
 df_green_sel = df_green \
-    .select(common_columns) \
+    .select(selected_columns) \
     .withColumn('service_type', F.lit('green'))
 
 df_yellow_sel = df_yellow \
-    .select(common_columns) \
+    .select(selected_columns) \
     .withColumn('service_type', F.lit('yellow'))
 
 
 df_trips_data = df_green_sel.unionAll(df_yellow_sel)
 
-df_trips_data.registerTempTable('trips_data')
+df_trips_data.createOrReplaceTempView('trips_data')
+df_green_sel.createOrReplaceTempView('green_trips_data')
+df_yellow_sel.createOrReplaceTempView('yellow_trips_data')
 
 
-df_result = spark.sql("""
+revenue_query = """
 SELECT 
     -- Revenue grouping 
     PULocationID AS revenue_zone,
@@ -99,13 +256,41 @@ SELECT
     AVG(passenger_count) AS avg_monthly_passenger_count,
     AVG(trip_distance) AS avg_monthly_trip_distance
 FROM
-    trips_data
+    {table}
 GROUP BY
     1, 2, 3
-""")
+"""
+
+if args.preaggregate:
+    # service_type is a grouping key, so the aggregate of each service type
+    # is already final and the union only appends the two results
+    df_result = spark.sql(revenue_query.format(table='green_trips_data')) \
+        .unionByName(spark.sql(revenue_query.format(table='yellow_trips_data')))
+else:
+    df_result = spark.sql(revenue_query.format(table='trips_data'))
+
+if args.explain:
+    df_result.explain(mode='formatted')
+
+
+if args.output_parquet and output:
+    # Both sinks write the same small result; aggregate the trips only once
+    df_result = df_result.cache()
+
+if args.output_trips:
+    df_trips_out = df_trips_data \
+        .withColumn('revenue_month', F.to_date(F.date_trunc('month', 'pickup_datetime')))
+    write_parquet(df_trips_out, args.output_trips)
+
+if args.output_parquet:
+    # A date instead of the midnight timestamp keeps the directory names readable
+    write_parquet(df_result.withColumn('revenue_month', F.to_date('revenue_month')), args.output_parquet)
 
+if output:
+    df_result.write.format('bigquery') \
+        .option('table', output) \
+        .save()
+    
 
-df_result.write.format('bigquery') \
-    .option('table', output) \
-    .save()
-    
\ No newline at end of file
+if args.explain:
+    print_stage_metrics()
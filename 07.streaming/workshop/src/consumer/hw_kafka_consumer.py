@@ -1,23 +1,32 @@
+import argparse
+import json
+import multiprocessing
 import os
 import sys
 from pathlib import Path
+from time import perf_counter, time
+import numpy as np
 from dotenv import load_dotenv
 from kafka import KafkaConsumer
 
 sys.path.insert(0, str(Path(__file__).parent.parent / 'producers'))
-from hw_producer import green_ride_deserializer
+from hw_producer import GREEN_RIDE_CODEC, green_ride_deserializer
+from serializers import FIELD_KINDS, MAGIC_AVRO, MAGIC_BINARY
 
 load_dotenv()
 
+TOPIC = 'green-trips'
+GROUP_ID = 'green-rides-counter'
+
 count = 0
 
 def main():
     redpanda_port = os.getenv('REDPANDA_PORT', '9092')
     consumer = KafkaConsumer(
-        'green-trips',
+        TOPIC,
         bootstrap_servers=[f'localhost:{redpanda_port}'],
         auto_offset_reset='earliest',
-        group_id='green-rides-counter',
+        group_id=GROUP_ID,
         value_deserializer=green_ride_deserializer
     )
 
@@ -28,10 +37,148 @@ def main():
         if ride.trip_distance > 5:
             count += 1
 
-if __name__ == '__main__':
+# numpy view of the fixed binary layout, so a batch of binary messages is
+# decoded with one np.frombuffer call
+NUMPY_CODES = {'i': '<i4', 'q': '<i8', 'd': '<f8'}
+BINARY_DTYPE = np.dtype(
+    [('magic', 'u1'), ('schema_id', '<u2')]
+    + [(name, NUMPY_CODES[FIELD_KINDS[kind][0]]) for name, kind in GREEN_RIDE_CODEC.fields.items()]
+)
+
+def column(values, kind):
+    if kind == 'datetime':
+        # "YYYY-MM-DD HH:MM:SS" strings and epoch milliseconds alike
+        return np.asarray(values).astype('datetime64[ms]')
+    return np.asarray(values)
+
+def decode_batch(values):
+    """Decode raw green-trips messages into one numpy array per field.
+
+    Binary messages are viewed in place, JSON ones parsed with one json.loads
+    per batch; rows from the different formats are concatenated.
+    """
+    fields = GREEN_RIDE_CODEC.fields
+    json_values, binary_values, avro_values = [], [], []
+    for value in values:
+        if value[0] == MAGIC_BINARY:
+            binary_values.append(value)
+        elif value[0] == MAGIC_AVRO:
+            avro_values.append(value)
+        else:
+            json_values.append(value)
+
+    parts = []
+    if json_values:
+        rows = json.loads(b'[' + b','.join(json_values) + b']')
+        parts.append({name: column([row[name] for row in rows], kind) for name, kind in fields.items()})
+    if binary_values:
+        records = np.frombuffer(b''.join(binary_values), dtype=BINARY_DTYPE)
+        parts.append({name: column(records[name], kind) for name, kind in fields.items()})
+    if avro_values:
+        # Variable-length encoding, so Avro still goes through the codec
+        rides = [GREEN_RIDE_CODEC.from_avro(value) for value in avro_values]
+        parts.append({name: column([getattr(ride, name) for ride in rides], kind) for name, kind in fields.items()})
+
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in fields}
+
+def long_ride(columns):
+    return columns['trip_distance'] > 5
+
+def consume_batches(worker, max_records, idle_timeout, results):
+    """One consumer of the group: count matching rides batch by batch.
+
+    Stops after idle_timeout seconds without messages (or on Ctrl+C) and puts
+    (worker, messages, matches) on the results queue.
+    """
+    redpanda_port = os.getenv('REDPANDA_PORT', '9092')
+    consumer = None
+    messages = matches = batches = 0
+    last_message = time()
     try:
-        main()
+        consumer = KafkaConsumer(
+            TOPIC,
+            bootstrap_servers=[f'localhost:{redpanda_port}'],
+            auto_offset_reset='earliest',
+            group_id=GROUP_ID,
+            max_poll_records=max_records,
+        )
+        while idle_timeout <= 0 or time() - last_message < idle_timeout:
+            polled = consumer.poll(timeout_ms=1000, max_records=max_records)
+            if not polled:
+                continue
+
+            start = perf_counter()
+            values = [message.value for records in polled.values() for message in records]
+            batch_matches = int(np.count_nonzero(long_ride(decode_batch(values))))
+            elapsed = perf_counter() - start
+
+            batches += 1
+            messages += len(values)
+            matches += batch_matches
+            last_message = time()
+
+            partitions = list(polled)
+            end_offsets = consumer.end_offsets(partitions)
+            lag = sum(end_offsets[tp] - consumer.position(tp) for tp in partitions)
+            print(f'[consumer {worker}] batch {batches}: {len(values)} messages, {batch_matches} matches, '
+                  f'{len(values) / elapsed:,.0f} messages/sec, lag {lag}')
     except KeyboardInterrupt:
-        print("\nThe consumer was stopped!")
+        pass
+    finally:
+        # Always report, so main_batched() never waits for a failed consumer
+        if consumer is not None:
+            consumer.close()
+        results.put((worker, messages, matches))
+
+def main_batched(processes, max_records, idle_timeout):
+    """Run processes consumers in the group and merge their counts."""
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=consume_batches, args=(worker, max_records, idle_timeout, results))
+        for worker in range(processes)
+    ]
+    for process in workers:
+        process.start()
+
+    start = time()
+    totals = {}
+    while len(totals) < processes:
+        try:
+            worker, messages, matches = results.get()
+            totals[worker] = (messages, matches)
+        except KeyboardInterrupt:
+            # Ctrl+C reaches the workers too; wait for their counts
+            continue
+    for process in workers:
+        process.join()
+
+    elapsed = time() - start
+    messages = sum(messages for messages, _ in totals.values())
+    for worker, (worker_messages, worker_matches) in sorted(totals.items()):
+        print(f'Consumer {worker}: {worker_messages} messages, {worker_matches} matches')
+    print(f'{messages} messages in {elapsed:.1f}s ({messages / elapsed:,.0f} messages/sec)')
+    return sum(matches for _, matches in totals.values())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count green taxi rides longer than 5 kilometers')
+    parser.add_argument('--batched', action='store_true',
+                        help='poll batches and filter them column-wise instead of message by message')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='consumer processes in the group in batched mode')
+    parser.add_argument('--max-records', type=int, default=5000,
+                        help='maximum messages per poll in batched mode')
+    parser.add_argument('--idle-timeout', type=float, default=10,
+                        help='stop batched consumers after this many seconds without messages (0: never)')
+    args = parser.parse_args()
+
+    if args.batched:
+        count = main_batched(args.processes, args.max_records, args.idle_timeout)
+    else:
+        try:
+            main()
+        except KeyboardInterrupt:
+            print("\nThe consumer was stopped!")
 
     print(f'Found {count} green taxi rides longer than 5 kilometers')
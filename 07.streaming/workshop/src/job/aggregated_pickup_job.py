@@ -1,90 +1,26 @@
-from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.table import EnvironmentSettings, StreamTableEnvironment
+"""Green trips per pickup location in 5 minute tumbling windows."""
+from job_builder import GREEN_TRIPS, GREEN_TRIPS_EVENT_TIME, jdbc_table, kafka_source, parse_args, run_job
 
+SOURCE = kafka_source('events', GREEN_TRIPS, 'green-trips', event_time=GREEN_TRIPS_EVENT_TIME)
 
-def create_events_source_kafka(t_env):
-    table_name = "events"
-    source_ddl = f"""
-        CREATE TABLE {table_name} (
-            lpep_pickup_datetime VARCHAR,
-            lpep_dropoff_datetime VARCHAR,
-            PULocationID INT,
-            DOLocationID INT,
-            passenger_count INT,
-            trip_distance DOUBLE,
-            tip_amount DOUBLE,
-            total_amount DOUBLE,
-            event_timestamp AS TO_TIMESTAMP(lpep_pickup_datetime, 'yyyy-MM-dd HH:mm:ss'),
-            WATERMARK FOR event_timestamp AS event_timestamp - INTERVAL '5' SECOND
-        ) WITH (
-            'connector' = 'kafka',
-            'properties.bootstrap.servers' = 'redpanda:29092',
-            'topic' = 'green-trips',
-            'scan.startup.mode' = 'earliest-offset',
-            'format' = 'json'
-        );
-        """
-    t_env.execute_sql(source_ddl)
-    return table_name
+SINK = jdbc_table('pickup_aggregated', [
+    ('window_start', 'TIMESTAMP(3)'),
+    ('PULocationID', 'INT'),
+    ('num_trips', 'BIGINT'),
+], primary_key=['window_start', 'PULocationID'])
 
-
-def create_aggregated_pickup_sink(t_env):
-    table_name = "pickup_aggregated"
-    sink_ddl = f"""
-        CREATE TABLE {table_name} (
-            window_start TIMESTAMP(3),
-            PULocationID INT,
-            num_trips BIGINT,
-            PRIMARY KEY (window_start, PULocationID) NOT ENFORCED
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = '{table_name}',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver'
-        );
-        """
-    t_env.execute_sql(sink_ddl)
-    return table_name
-
-
-def log_aggregation():
-    env = StreamExecutionEnvironment.get_execution_environment()
-    env.enable_checkpointing(10 * 1000)
-    env.set_parallelism(1)  # must be 1 because green-trips has 1 partition
-
-    settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
-    t_env = StreamTableEnvironment.create(env, environment_settings=settings)
-
-    source_table = create_events_source_kafka(t_env)
-    sink_table = create_aggregated_pickup_sink(t_env)
-
-    print("Submitting streaming job...")
-
-    insert_stmt = t_env.execute_sql(f"""
-        INSERT INTO {sink_table}
-        SELECT
-            window_start,
-            PULocationID,
-            COUNT(*) AS num_trips
-        FROM TABLE(
-            TUMBLE(TABLE {source_table}, DESCRIPTOR(event_timestamp), INTERVAL '5' MINUTE)
-        )
-        GROUP BY window_start, PULocationID;
-    """)
-
-    job_client = insert_stmt.get_job_client()
-    if job_client is not None:
-        job_id = job_client.get_job_id()
-        print(f"Job submitted successfully!")
-        print(f"Job ID: {job_id}")
-        print(f"Check status and logs in Flink UI: http://localhost:8081")
-        print("The job is now running in detached mode (script can exit).")
-        print("Aggregated results will appear in Postgres table 'pickup_aggregated' once windows close.")
-    else:
-        print("Warning: Could not get JobClient. Job may not have been submitted properly.")
+QUERY = """
+    SELECT
+        window_start,
+        PULocationID,
+        COUNT(*) AS num_trips
+    FROM TABLE(
+        TUMBLE(TABLE events, DESCRIPTOR(event_timestamp), INTERVAL '5' MINUTE)
+    )
+    GROUP BY window_start, PULocationID
+"""
 
 
 if __name__ == '__main__':
-    log_aggregation()
\ No newline at end of file
+    run_job(parse_args(__doc__, default_parallelism='1'), [SOURCE, SINK], 'pickup_aggregated', QUERY, topic='green-trips', wait=False)
+    print("Aggregated results will appear in Postgres table 'pickup_aggregated' once windows close.")
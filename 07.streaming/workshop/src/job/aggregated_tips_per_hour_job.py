@@ -1,77 +1,24 @@
-from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.table import EnvironmentSettings, StreamTableEnvironment
+"""Total green trip tips in 1 hour tumbling windows, over the topic as it is now."""
+from job_builder import GREEN_TRIPS, GREEN_TRIPS_EVENT_TIME, jdbc_table, kafka_source, parse_args, run_job
 
+SOURCE = kafka_source('events', GREEN_TRIPS, 'green-trips', event_time=GREEN_TRIPS_EVENT_TIME,
+                      options={'scan.bounded.mode': 'latest-offset'})
 
-def create_events_source_kafka(t_env):
-    table_name = "events"
-    source_ddl = f"""
-        CREATE TABLE {table_name} (
-            lpep_pickup_datetime STRING,
-            lpep_dropoff_datetime STRING,
-            PULocationID INTEGER,
-            DOLocationID INTEGER,
-            passenger_count INTEGER,
-            trip_distance DOUBLE,
-            tip_amount DOUBLE,
-            total_amount DOUBLE,
-            event_timestamp AS TO_TIMESTAMP(lpep_pickup_datetime, 'yyyy-MM-dd HH:mm:ss'),
-            WATERMARK FOR event_timestamp AS event_timestamp - INTERVAL '5' SECOND
-        ) WITH (
-            'connector' = 'kafka',
-            'properties.bootstrap.servers' = 'redpanda:29092',
-            'topic' = 'green-trips',
-            'scan.startup.mode' = 'earliest-offset',
-            'scan.bounded.mode' = 'latest-offset',
-            'properties.auto.offset.reset' = 'earliest',
-            'format' = 'json'
-        );
-        """
-    t_env.execute_sql(source_ddl)
-    return table_name
+SINK = jdbc_table('tips_per_hour_aggregated', [
+    ('window_start', 'TIMESTAMP(3)'),
+    ('total_tips', 'DOUBLE'),
+], primary_key=['window_start'])
 
-
-def create_aggregated_tips_per_hour_sink(t_env):
-    table_name = "tips_per_hour_aggregated"
-    sink_ddl = f"""
-        CREATE TABLE {table_name} (
-            window_start TIMESTAMP(3),
-            total_tips   DOUBLE,
-            PRIMARY KEY (window_start) NOT ENFORCED
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = '{table_name}',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver'
-        );
-        """
-    t_env.execute_sql(sink_ddl)
-    return table_name
-
-
-def log_aggregation():
-    env = StreamExecutionEnvironment.get_execution_environment()
-    env.enable_checkpointing(10 * 1000)
-    env.set_parallelism(1)
-
-    settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
-    t_env = StreamTableEnvironment.create(env, environment_settings=settings)
-
-    source_table = create_events_source_kafka(t_env)
-    sink_table = create_aggregated_tips_per_hour_sink(t_env)
-
-    t_env.execute_sql(f"""
-        INSERT INTO {sink_table}
-        SELECT
-            window_start,
-            SUM(tip_amount) AS total_tips
-        FROM TABLE(
-            TUMBLE(TABLE {source_table}, DESCRIPTOR(event_timestamp), INTERVAL '1' HOUR)
-        )
-        GROUP BY window_start;
-    """).wait()
+QUERY = """
+    SELECT
+        window_start,
+        SUM(tip_amount) AS total_tips
+    FROM TABLE(
+        TUMBLE(TABLE events, DESCRIPTOR(event_timestamp), INTERVAL '1' HOUR)
+    )
+    GROUP BY window_start
+"""
 
 
 if __name__ == '__main__':
-    log_aggregation()
\ No newline at end of file
+    run_job(parse_args(__doc__, default_parallelism='1'), [SOURCE, SINK], 'tips_per_hour_aggregated', QUERY, topic='green-trips')
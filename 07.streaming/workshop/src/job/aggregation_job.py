@@ -1,82 +1,27 @@
-from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.table import EnvironmentSettings, StreamTableEnvironment
-
-
-def create_events_source_kafka(t_env):
-    table_name = "events"
-    source_ddl = f"""
-        CREATE TABLE {table_name} (
-            PULocationID INTEGER,
-            DOLocationID INTEGER,
-            trip_distance DOUBLE,
-            total_amount DOUBLE,
-            tpep_pickup_datetime BIGINT,
-            event_timestamp AS TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3),
-            WATERMARK for event_timestamp as event_timestamp - INTERVAL '5' SECOND
-        ) WITH (
-            'connector' = 'kafka',
-            'properties.bootstrap.servers' = 'redpanda:29092',
-            'topic' = 'rides',
-            'scan.startup.mode' = 'earliest-offset',
-            'properties.auto.offset.reset' = 'earliest',
-            'format' = 'json'
-        );
-        """
-    t_env.execute_sql(source_ddl)
-    return table_name
-
-
-def create_events_aggregated_sink(t_env):
-    table_name = 'processed_events_aggregated'
-    sink_ddl = f"""
-        CREATE TABLE {table_name} (
-            window_start TIMESTAMP(3),
-            PULocationID INT,
-            num_trips BIGINT,
-            total_revenue DOUBLE,
-            PRIMARY KEY (window_start, PULocationID) NOT ENFORCED
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = '{table_name}',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver'
-        );
-        """
-    t_env.execute_sql(sink_ddl)
-    return table_name
-
-
-def log_aggregation():
-    env = StreamExecutionEnvironment.get_execution_environment()
-    env.enable_checkpointing(10 * 1000)
-    env.set_parallelism(1)
-
-    settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
-    t_env = StreamTableEnvironment.create(env, environment_settings=settings)
-
-    try:
-        source_table = create_events_source_kafka(t_env)
-        aggregated_table = create_events_aggregated_sink(t_env)
-
-        t_env.execute_sql(f"""
-        INSERT INTO {aggregated_table}
-        SELECT
-            window_start,
-            PULocationID,
-            COUNT(*) AS num_trips,
-            SUM(total_amount) AS total_revenue
-        FROM TABLE(
-            TUMBLE(TABLE {source_table}, DESCRIPTOR(event_timestamp), INTERVAL '1' HOUR)
-        )
-        GROUP BY window_start, PULocationID;
-
-        """).wait()
-
-    except Exception as e:
-        print("Writing records from Kafka to JDBC failed:", str(e))
+"""Trips and revenue per pickup location in 1 hour tumbling windows."""
+from job_builder import RIDES, RIDES_EVENT_TIME, jdbc_table, kafka_source, parse_args, run_job
+
+SOURCE = kafka_source('events', RIDES, 'rides', event_time=RIDES_EVENT_TIME)
+
+SINK = jdbc_table('processed_events_aggregated', [
+    ('window_start', 'TIMESTAMP(3)'),
+    ('PULocationID', 'INT'),
+    ('num_trips', 'BIGINT'),
+    ('total_revenue', 'DOUBLE'),
+], primary_key=['window_start', 'PULocationID'])
+
+QUERY = """
+    SELECT
+        window_start,
+        PULocationID,
+        COUNT(*) AS num_trips,
+        SUM(total_amount) AS total_revenue
+    FROM TABLE(
+        TUMBLE(TABLE events, DESCRIPTOR(event_timestamp), INTERVAL '1' HOUR)
+    )
+    GROUP BY window_start, PULocationID
+"""
 
 
 if __name__ == '__main__':
-    log_aggregation()
\ No newline at end of file
+    run_job(parse_args(__doc__, default_parallelism='1'), [SOURCE, SINK], 'processed_events_aggregated', QUERY, topic='rides')
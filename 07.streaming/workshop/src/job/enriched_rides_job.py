@@ -1,99 +1,134 @@
-from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.table import EnvironmentSettings, StreamTableEnvironment
-
-
-def create_rides_source(t_env):
-    t_env.execute_sql("""
-        CREATE TABLE rides (
-            PULocationID INTEGER,
-            DOLocationID INTEGER,
-            trip_distance DOUBLE,
-            total_amount DOUBLE,
-            tpep_pickup_datetime BIGINT,
-            proc_time AS PROCTIME()
-        ) WITH (
-            'connector' = 'kafka',
-            'properties.bootstrap.servers' = 'redpanda:29092',
-            'topic' = 'rides',
-            'scan.startup.mode' = 'latest-offset',
-            'format' = 'json'
-        )
-    """)
-    return 'rides'
-
-
-def create_zones_lookup(t_env):
-    t_env.execute_sql("""
-        CREATE TABLE zones (
-            location_id INTEGER,
-            borough VARCHAR,
-            zone VARCHAR,
-            PRIMARY KEY (location_id) NOT ENFORCED
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = 'zones',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver',
-            'lookup.cache.max-rows' = '265',
-            'lookup.cache.ttl' = '1 hour'
-        )
-    """)
-    return 'zones'
-
-
-def create_enriched_sink(t_env):
-    t_env.execute_sql("""
-        CREATE TABLE enriched_rides (
-            PULocationID INTEGER,
-            pickup_zone VARCHAR,
-            DOLocationID INTEGER,
-            dropoff_zone VARCHAR,
-            trip_distance DOUBLE,
-            total_amount DOUBLE,
-            pickup_datetime TIMESTAMP
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = 'enriched_rides',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver'
-        )
-    """)
-    return 'enriched_rides'
-
-
-def enrich_rides():
-    env = StreamExecutionEnvironment.get_execution_environment()
-    env.enable_checkpointing(10 * 1000)
-
-    t_env = StreamTableEnvironment.create(
-        env, EnvironmentSettings.new_instance().in_streaming_mode().build()
-    )
+"""Rides joined with the pickup and dropoff zone names from Postgres.
+
+--lookup picks how the zone names are looked up:
+
+  partial  JDBC lookup join with a partial cache; a miss is a synchronous
+           Postgres query (default)
+  full     every subtask preloads the whole zones table and reloads it every
+           --zones-reload-interval seconds
+  async    asynchronous Postgres queries, --lookup-capacity rides in flight
+           per subtask, for dimensions too large to cache
+
+To compare them, submit the job with each mode and measure it with
+sink_benchmark.py enriched_rides --latency.
+"""
+from pyflink.common import Time, Types
+from pyflink.datastream import AsyncDataStream
+from pyflink.table import DataTypes
+from pyflink.table.udf import udf
+
+import zone_lookup
+from job_builder import RIDES, jdbc_table, kafka_source, parse_args, run_job, ship_with_job
 
-    rides  = create_rides_source(t_env)
-    zones  = create_zones_lookup(t_env)
-    sink   = create_enriched_sink(t_env)
+SOURCE = kafka_source('rides', RIDES, 'rides', startup_mode='latest-offset', proc_time=True)
 
-    t_env.execute_sql(f"""
-        INSERT INTO {sink}
+ZONES = jdbc_table('zones', [
+    ('location_id', 'INTEGER'),
+    ('borough', 'VARCHAR'),
+    ('zone', 'VARCHAR'),
+], primary_key=['location_id'], options={
+    'lookup.cache.max-rows': '265',
+    'lookup.cache.ttl': '1 hour',
+})
+
+ENRICHED_COLUMNS = [
+    ('PULocationID', 'INTEGER'),
+    ('pickup_zone', 'VARCHAR'),
+    ('DOLocationID', 'INTEGER'),
+    ('dropoff_zone', 'VARCHAR'),
+    ('trip_distance', 'DOUBLE'),
+    ('total_amount', 'DOUBLE'),
+    ('pickup_datetime', 'TIMESTAMP'),
+]
+
+SINK = jdbc_table('enriched_rides', ENRICHED_COLUMNS)
+
+QUERY = """
+    SELECT
+        r.PULocationID,
+        zpu.zone AS pickup_zone,
+        r.DOLocationID,
+        zdo.zone AS dropoff_zone,
+        r.trip_distance,
+        r.total_amount,
+        TO_TIMESTAMP_LTZ(r.tpep_pickup_datetime, 3) AS pickup_datetime
+    FROM rides AS r
+    JOIN zones FOR SYSTEM_TIME AS OF r.proc_time AS zpu
+        ON r.PULocationID = zpu.location_id
+    JOIN zones FOR SYSTEM_TIME AS OF r.proc_time AS zdo
+        ON r.DOLocationID = zdo.location_id
+"""
+
+# Rides with an unknown zone are dropped, as by the inner lookup join
+FULL_CACHE_QUERY = """
+    SELECT * FROM (
         SELECT
-            r.PULocationID,
-            zpu.zone AS pickup_zone,
-            r.DOLocationID,
-            zdo.zone AS dropoff_zone,
-            r.trip_distance,
-            r.total_amount,
-            TO_TIMESTAMP_LTZ(r.tpep_pickup_datetime, 3) AS pickup_datetime
-        FROM {rides} AS r
-        JOIN {zones} FOR SYSTEM_TIME AS OF r.proc_time AS zpu
-            ON r.PULocationID = zpu.location_id
-        JOIN {zones} FOR SYSTEM_TIME AS OF r.proc_time AS zdo
-            ON r.DOLocationID = zdo.location_id
-    """).wait()
+            PULocationID,
+            zone_name(PULocationID) AS pickup_zone,
+            DOLocationID,
+            zone_name(DOLocationID) AS dropoff_zone,
+            trip_distance,
+            total_amount,
+            TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3) AS pickup_datetime
+        FROM rides
+    )
+    WHERE pickup_zone IS NOT NULL AND dropoff_zone IS NOT NULL
+"""
+
+ASYNC_QUERY = """
+    SELECT
+        PULocationID,
+        pickup_zone,
+        DOLocationID,
+        dropoff_zone,
+        trip_distance,
+        total_amount,
+        TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3) AS pickup_datetime
+    FROM rides_with_zones
+"""
+
+
+def add_arguments(parser):
+    parser.add_argument('--lookup', choices=['partial', 'full', 'async'], default='partial',
+                        help='how zone names are looked up')
+    parser.add_argument('--zones-reload-interval', type=float, default=3600,
+                        help='seconds between zones reloads with --lookup full')
+    parser.add_argument('--lookup-capacity', type=int, default=100,
+                        help='rides looked up concurrently per subtask with --lookup async')
+    parser.add_argument('--lookup-timeout', type=int, default=30,
+                        help='seconds before an async lookup fails the job')
+    parser.add_argument('--lookup-pool-size', type=int, default=10,
+                        help='Postgres connections per subtask with --lookup async')
+
+
+def register_zone_names(t_env, args):
+    t_env.create_temporary_function(
+        'zone_name', udf(zone_lookup.ZoneNames(args.zones_reload_interval), result_type=DataTypes.STRING()))
+
+
+def register_async_lookup(t_env, args):
+    rides = t_env.to_data_stream(t_env.sql_query(
+        "SELECT PULocationID, DOLocationID, trip_distance, total_amount, tpep_pickup_datetime FROM rides"
+    ))
+    output_type = Types.ROW_NAMED(
+        [name for name, _ in ENRICHED_COLUMNS[:-1]] + ['tpep_pickup_datetime'],
+        [Types.INT(), Types.STRING(), Types.INT(), Types.STRING(), Types.DOUBLE(), Types.DOUBLE(),
+         Types.LONG()],
+    )
+    # Unordered: the sink is append-only, so rides may be written in any order
+    enriched = AsyncDataStream.unordered_wait(
+        rides, zone_lookup.AsyncZoneLookup(args.lookup_pool_size), Time.seconds(args.lookup_timeout),
+        capacity=args.lookup_capacity, output_type=output_type,
+    )
+    t_env.create_temporary_view('rides_with_zones', t_env.from_data_stream(enriched))
 
 
 if __name__ == '__main__':
-    enrich_rides()
\ No newline at end of file
+    args = parse_args(__doc__, add_arguments)
+    ship_with_job(zone_lookup)
+    if args.lookup == 'full':
+        run_job(args, [SOURCE, SINK], 'enriched_rides', FULL_CACHE_QUERY, topic='rides', setup=register_zone_names)
+    elif args.lookup == 'async':
+        run_job(args, [SOURCE, SINK], 'enriched_rides', ASYNC_QUERY, topic='rides', setup=register_async_lookup)
+    else:
+        run_job(args, [SOURCE, ZONES, SINK], 'enriched_rides', QUERY, topic='rides')
@@ -0,0 +1,285 @@
+"""Shared setup for the PyFlink jobs: table DDL, CLI flags and the environment.
+
+A job file only keeps its tables and the query that fills the sink:
+
+    SOURCE = kafka_source('events', GREEN_TRIPS, 'green-trips', event_time=GREEN_TRIPS_EVENT_TIME)
+    SINK = jdbc_table('pickup_aggregated', [...], primary_key=[...])
+
+    if __name__ == '__main__':
+        run_job(parse_args(__doc__), [SOURCE, SINK], 'pickup_aggregated', QUERY, topic='green-trips')
+
+and accepts the same flags, e.g. to run one subtask per topic partition:
+
+    docker compose exec jobmanager ./bin/flink run \\
+        -py /opt/src/job/aggregated_pickup_job.py --pyFiles /opt/src -d \\
+        --job-parallelism auto --agg-phase-strategy TWO_PHASE
+
+Job flags go after the flink options. They are named so that flink does not
+take them for its own (its -p/--parallelism would).
+
+The --sink-* flags tune the Postgres sink: buffering and retries of the JDBC
+connector, or --sink-mode copy to load rows with COPY (postgres_copy_sink.py).
+"""
+import argparse
+import json
+import urllib.request
+
+import cloudpickle
+
+from pyflink.common import Configuration, Types
+from pyflink.datastream import StreamExecutionEnvironment
+from pyflink.table import EnvironmentSettings, StreamTableEnvironment
+
+import postgres_copy_sink
+
+KAFKA_BOOTSTRAP_SERVERS = 'redpanda:29092'
+# Redpanda's HTTP proxy, used to look up the partition count of a topic
+PANDAPROXY_URL = 'http://redpanda:28082'
+POSTGRES_URL = 'jdbc:postgresql://postgres:5432/postgres'
+
+# Message schemas of the two topics (see src/producers)
+RIDES = [
+    ('PULocationID', 'INTEGER'),
+    ('DOLocationID', 'INTEGER'),
+    ('trip_distance', 'DOUBLE'),
+    ('total_amount', 'DOUBLE'),
+    ('tpep_pickup_datetime', 'BIGINT'),
+]
+
+GREEN_TRIPS = [
+    ('lpep_pickup_datetime', 'VARCHAR'),
+    ('lpep_dropoff_datetime', 'VARCHAR'),
+    ('PULocationID', 'INTEGER'),
+    ('DOLocationID', 'INTEGER'),
+    ('passenger_count', 'INTEGER'),
+    ('trip_distance', 'DOUBLE'),
+    ('tip_amount', 'DOUBLE'),
+    ('total_amount', 'DOUBLE'),
+]
+
+RIDES_EVENT_TIME = 'TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3)'
+GREEN_TRIPS_EVENT_TIME = "TO_TIMESTAMP(lpep_pickup_datetime, 'yyyy-MM-dd HH:mm:ss')"
+
+
+def with_clause(options):
+    return ',\n'.join(f"    '{key}' = '{value}'" for key, value in options.items())
+
+
+def create_table(name, columns, options, extra_lines=()):
+    lines = [f'    {column} {type_}' for column, type_ in columns] + [f'    {line}' for line in extra_lines]
+    return f"CREATE TABLE {name} (\n" + ',\n'.join(lines) + f"\n) WITH (\n{with_clause(options)}\n)"
+
+
+def kafka_source(name, columns, topic, startup_mode='earliest-offset', event_time=None,
+                 lateness="INTERVAL '5' SECOND", proc_time=False, options=None):
+    """DDL of a JSON Kafka source table.
+
+    event_time adds an event_timestamp column computed by that expression and
+    a watermark lateness behind it; proc_time adds a proc_time column.
+    """
+    extra_lines = []
+    if event_time:
+        extra_lines.append(f'event_timestamp AS {event_time}')
+        extra_lines.append(f'WATERMARK FOR event_timestamp AS event_timestamp - {lateness}')
+    if proc_time:
+        extra_lines.append('proc_time AS PROCTIME()')
+    return create_table(name, columns, {
+        'connector': 'kafka',
+        'properties.bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
+        'topic': topic,
+        'scan.startup.mode': startup_mode,
+        'properties.auto.offset.reset': startup_mode.split('-')[0],
+        'format': 'json',
+        **(options or {}),
+    }, extra_lines)
+
+
+def jdbc_table(name, columns, primary_key=None, options=None):
+    """DDL of a Postgres table used as a sink or lookup table."""
+    extra_lines = [f"PRIMARY KEY ({', '.join(primary_key)}) NOT ENFORCED"] if primary_key else []
+    return create_table(name, columns, {
+        'connector': 'jdbc',
+        'url': POSTGRES_URL,
+        'table-name': name,
+        'username': 'postgres',
+        'password': 'postgres',
+        'driver': 'org.postgresql.Driver',
+        **(options or {}),
+    }, extra_lines)
+
+
+def parse_args(description, add_arguments=None, default_parallelism=None):
+    """Parse the common job flags, plus the job's own added by add_arguments(parser).
+
+    Without default_parallelism the job keeps the parallelism flink gives it
+    (-p or parallelism.default) unless --job-parallelism is set.
+    """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--job-parallelism', default=default_parallelism,
+                        help="job parallelism, or 'auto' for the partition count of the source topic "
+                             f"(default: {default_parallelism or 'the flink default'})")
+    parser.add_argument('--checkpoint-interval', type=int, default=10,
+                        help='seconds between checkpoints')
+    parser.add_argument('--state-backend', choices=['hashmap', 'rocksdb'], default='hashmap',
+                        help='where keyed state lives: the JVM heap or RocksDB on disk')
+    parser.add_argument('--mini-batch', action='store_true',
+                        help='buffer input records and update aggregation state once per batch')
+    parser.add_argument('--mini-batch-latency', default='1 s',
+                        help='maximum time records are buffered with --mini-batch')
+    parser.add_argument('--mini-batch-size', type=int, default=5000,
+                        help='maximum records buffered with --mini-batch')
+    parser.add_argument('--agg-phase-strategy', choices=['AUTO', 'ONE_PHASE', 'TWO_PHASE'], default='AUTO',
+                        help='TWO_PHASE pre-aggregates locally before the shuffle (local-global aggregation)')
+    parser.add_argument('--source-idle-timeout',
+                        help="e.g. '30 s': let watermarks advance past partitions without data")
+
+    sink = parser.add_argument_group('Postgres sink')
+    sink.add_argument('--sink-mode', choices=['jdbc', 'copy'], default='jdbc',
+                      help='JDBC connector batch inserts, or COPY (merged through a staging table on the primary key)')
+    sink.add_argument('--sink-flush-rows', type=int,
+                      help='rows buffered per subtask before a flush (connector default 100, copy 5000)')
+    sink.add_argument('--sink-flush-interval', type=float,
+                      help='seconds before buffered rows are flushed anyway, 0 to disable (default 1)')
+    sink.add_argument('--sink-max-retries', type=int,
+                      help='retries of a failed flush (default 3)')
+    sink.add_argument('--sink-parallelism', type=int,
+                      help='sink subtasks (default: the job parallelism)')
+
+    if add_arguments is not None:
+        add_arguments(parser)
+    return parser.parse_args()
+
+
+def sink_options(args):
+    """JDBC connector options for the --sink-* flags that were given."""
+    options = {}
+    if args.sink_flush_rows is not None:
+        options['sink.buffer-flush.max-rows'] = args.sink_flush_rows
+    if args.sink_flush_interval is not None:
+        options['sink.buffer-flush.interval'] = f'{round(args.sink_flush_interval * 1000)} ms'
+    if args.sink_max_retries is not None:
+        options['sink.max-retries'] = args.sink_max_retries
+    if args.sink_parallelism is not None:
+        options['sink.parallelism'] = args.sink_parallelism
+    return options
+
+
+def topic_partitions(topic):
+    with urllib.request.urlopen(f'{PANDAPROXY_URL}/topics/{topic}/partitions', timeout=10) as response:
+        return len(json.load(response))
+
+
+def create_table_env(args, topic=None):
+    """Stream and table environments configured from the parse_args() flags."""
+    config = Configuration()
+    config.set_string('state.backend.type', args.state_backend)
+    env = StreamExecutionEnvironment.get_execution_environment(config)
+    env.enable_checkpointing(args.checkpoint_interval * 1000)
+
+    if args.job_parallelism == 'auto':
+        # More source subtasks than partitions would leave some idle and hold
+        # back the watermark, so match the partition count
+        parallelism = topic_partitions(topic)
+        print(f'Topic {topic} has {parallelism} partitions, using parallelism {parallelism}')
+        env.set_parallelism(parallelism)
+    elif args.job_parallelism is not None:
+        env.set_parallelism(int(args.job_parallelism))
+
+    settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
+    t_env = StreamTableEnvironment.create(env, environment_settings=settings)
+
+    table_config = t_env.get_config()
+    table_config.set('table.optimizer.agg-phase-strategy', args.agg_phase_strategy)
+    if args.mini_batch:
+        table_config.set('table.exec.mini-batch.enabled', 'true')
+        table_config.set('table.exec.mini-batch.allow-latency', args.mini_batch_latency)
+        table_config.set('table.exec.mini-batch.size', str(args.mini_batch_size))
+    if args.source_idle_timeout:
+        table_config.set('table.exec.source.idle-timeout', args.source_idle_timeout)
+    return env, t_env
+
+
+def ship_with_job(module):
+    """Pickle the functions and classes of module by value.
+
+    The workers only have /opt/src on their path (--pyFiles), so modules
+    next to the job in /opt/src/job are not importable there.
+    """
+    cloudpickle.register_pickle_by_value(module)
+
+
+def run_job(args, ddl, sink, query, topic=None, wait=True, setup=None):
+    """Create the tables, write the rows of query into the sink table and
+    wait for the job unless wait is False. A failed job is raised.
+
+    setup(t_env, args) is called after the tables are created, to register
+    the functions or views the query uses.
+    """
+    env, t_env = create_table_env(args, topic)
+    for statement in ddl:
+        t_env.execute_sql(statement)
+    if setup is not None:
+        setup(t_env, args)
+
+    if args.sink_mode == 'copy':
+        submit = copy_into_postgres(args, env, t_env, sink, query)
+    else:
+        # Dynamic table options override the sink's WITH clause for this insert
+        options = ', '.join(f"'{key}' = '{value}'" for key, value in sink_options(args).items())
+        hint = f'/*+ OPTIONS({options}) */ ' if options else ''
+        insert_sql = f"INSERT INTO {sink} {hint}{query}"
+
+        def submit():
+            return t_env.execute_sql(insert_sql).get_job_client()
+
+    if wait:
+        try:
+            job_client = submit()
+            job_client.get_job_execution_result().result()
+        except Exception as e:
+            print("Writing records from Kafka to JDBC failed:", str(e))
+            raise
+        return
+
+    print("Submitting streaming job...")
+    job_client = submit()
+    if job_client is not None:
+        print("Job submitted successfully!")
+        print(f"Job ID: {job_client.get_job_id()}")
+        print("Check status and logs in Flink UI: http://localhost:8081")
+        print("The job is now running in detached mode (script can exit).")
+    else:
+        print("Warning: Could not get JobClient. Job may not have been submitted properly.")
+
+
+def copy_into_postgres(args, env, t_env, sink, query):
+    """Add a PostgresCopyWriter for query to env and return the submit function.
+
+    Rows are keyed by a shard of the sink's primary key (or of the whole row
+    without one), so all changes to a key reach the same writer in order.
+    """
+    table = t_env.sql_query(query)
+    columns = table.get_resolved_schema().get_column_names()
+    primary_key = t_env.from_path(sink).get_resolved_schema().get_primary_key()
+    primary_key = primary_key.get_columns() if primary_key else []
+    key_positions = [columns.index(name) for name in primary_key] or list(range(len(columns)))
+    parallelism = args.sink_parallelism or env.get_parallelism()
+    shards = max(parallelism, 1) * postgres_copy_sink.SHARDS_PER_SUBTASK
+
+    ship_with_job(postgres_copy_sink)
+    writer = postgres_copy_sink.PostgresCopyWriter(
+        sink, columns, primary_key,
+        flush_rows=args.sink_flush_rows or 5000,
+        flush_interval=1.0 if args.sink_flush_interval is None else args.sink_flush_interval,
+        max_retries=3 if args.sink_max_retries is None else args.sink_max_retries,
+    )
+    stream = t_env.to_changelog_stream(table) \
+        .key_by(lambda row: postgres_copy_sink.shard_of(tuple(row[i] for i in key_positions), shards),
+                key_type=Types.INT()) \
+        .process(writer)
+    if args.sink_parallelism is not None:
+        stream.set_parallelism(args.sink_parallelism)
+
+    def submit():
+        return env.execute_async(f'copy into {sink}')
+    return submit
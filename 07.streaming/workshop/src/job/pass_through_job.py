@@ -1,79 +1,26 @@
-from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.table import EnvironmentSettings, StreamTableEnvironment
-
-
-def create_processed_events_sink_postgres(t_env):
-    table_name = 'processed_events'
-    sink_ddl = f"""
-        CREATE TABLE {table_name} (
-            PULocationID INTEGER,
-            DOLocationID INTEGER,
-            trip_distance DOUBLE,
-            total_amount DOUBLE,
-            pickup_datetime TIMESTAMP
-        ) WITH (
-            'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://postgres:5432/postgres',
-            'table-name' = '{table_name}',
-            'username' = 'postgres',
-            'password' = 'postgres',
-            'driver' = 'org.postgresql.Driver'
-        );
-        """
-    t_env.execute_sql(sink_ddl)
-    return table_name
-
-
-def create_events_source_kafka(t_env):
-    table_name = "events"
-    source_ddl = f"""
-        CREATE TABLE {table_name} (
-            PULocationID INTEGER,
-            DOLocationID INTEGER,
-            trip_distance DOUBLE,
-            total_amount DOUBLE,
-            tpep_pickup_datetime BIGINT
-        ) WITH (
-            'connector' = 'kafka',
-            'properties.bootstrap.servers' = 'redpanda:29092',
-            'topic' = 'rides',
-            'scan.startup.mode' = 'latest-offset',
-            'properties.auto.offset.reset' = 'latest',
-            'format' = 'json'
-        );
-        """
-    t_env.execute_sql(source_ddl)
-    return table_name
-
-def log_processing():
-    # Set up the execution environment
-    env = StreamExecutionEnvironment.get_execution_environment()
-    env.enable_checkpointing(10 * 1000)
-
-    # Set up the table environment
-    settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
-    t_env = StreamTableEnvironment.create(env, environment_settings=settings)
-    try:
-        # Create Kafka table
-        source_table = create_events_source_kafka(t_env)
-        postgres_sink = create_processed_events_sink_postgres(t_env)
-        # write records to postgres
-        t_env.execute_sql(
-            f"""
-                    INSERT INTO {postgres_sink}
-                    SELECT
-                        PULocationID,
-                        DOLocationID,
-                        trip_distance,
-                        total_amount,
-                        TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3) as pickup_datetime
-                    FROM {source_table}
-                    """
-        ).wait()
-
-    except Exception as e:
-        print("Writing records from Kafka to JDBC failed:", str(e))
+"""Copy every ride from the rides topic to the processed_events table."""
+from job_builder import RIDES, jdbc_table, kafka_source, parse_args, run_job
+
+SOURCE = kafka_source('events', RIDES, 'rides', startup_mode='latest-offset')
+
+SINK = jdbc_table('processed_events', [
+    ('PULocationID', 'INTEGER'),
+    ('DOLocationID', 'INTEGER'),
+    ('trip_distance', 'DOUBLE'),
+    ('total_amount', 'DOUBLE'),
+    ('pickup_datetime', 'TIMESTAMP'),
+])
+
+QUERY = """
+    SELECT
+        PULocationID,
+        DOLocationID,
+        trip_distance,
+        total_amount,
+        TO_TIMESTAMP_LTZ(tpep_pickup_datetime, 3) as pickup_datetime
+    FROM events
+"""
 
 
 if __name__ == '__main__':
-    log_processing()
\ No newline at end of file
+    run_job(parse_args(__doc__), [SOURCE, SINK], 'processed_events', QUERY, topic='rides')
@@ -0,0 +1,193 @@
+"""Load generator for the Postgres sinks: end-to-end rides/sec per sink configuration.
+
+Submit the job with the sink configuration to measure, then send it rides:
+
+    docker compose exec jobmanager ./bin/flink run \\
+        -py /opt/src/job/pass_through_job.py --pyFiles /opt/src -d \\
+        --sink-mode copy --sink-flush-rows 10000
+    uv run python src/job/sink_benchmark.py pass_through --rides 200000 --label 'copy 10000'
+
+Cancel the job and repeat for the next configuration. The rate is the
+number of rides that reached Postgres over the time from the first send to
+the last arrival, so it covers Kafka, the job and the sink.
+
+With --latency, the sink table gets a loaded_at column filled by Postgres
+on insert for the duration of the run (dropped again at the end), and the
+per-ride latency from send (the pickup time) to insert is reported as
+percentiles, e.g. to compare the zone lookup modes of enriched_rides_job.py:
+
+    uv run python src/job/sink_benchmark.py enriched_rides --latency --label 'lookup full'
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'producers'))
+from models import RIDE_CODEC, Ride
+from producer_factory import create_producer
+
+# Job -> query for how many rides the sink has received so far
+PROGRESS_QUERIES = {
+    'pass_through': 'SELECT count(*) FROM processed_events',
+    'enriched_rides': 'SELECT count(*) FROM enriched_rides',
+    'aggregation': 'SELECT coalesce(sum(num_trips), 0) FROM processed_events_aggregated',
+}
+
+# Sink tables with a pickup_datetime per ride, for --latency
+LATENCY_TABLES = {
+    'pass_through': 'processed_events',
+    'enriched_rides': 'enriched_rides',
+}
+
+
+def progress(conn, job):
+    with conn.cursor() as cur:
+        cur.execute(PROGRESS_QUERIES[job])
+        value = cur.fetchone()[0]
+    conn.commit()
+    return value
+
+
+def first_pickup(conn, job):
+    """Event time (UTC, like the job's windows) to start the rides at.
+
+    The aggregation job only counts rides past its watermark, which the
+    closing ride of a previous run has moved hours ahead, so start after it.
+    """
+    start = datetime.now(timezone.utc).replace(tzinfo=None)
+    if job == 'aggregation':
+        with conn.cursor() as cur:
+            cur.execute('SELECT max(window_start) FROM processed_events_aggregated')
+            last_window = cur.fetchone()[0]
+        conn.commit()
+        if last_window is not None:
+            start = max(start, last_window + timedelta(hours=3))
+    return start
+
+
+def send_rides(producer, count, start, realtime=False):
+    """Send count rides picked up 1 ms apart from start, or at the time they
+    are sent with realtime."""
+    start_ms = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    for i in range(count):
+        producer.send('rides', value=Ride(
+            PULocationID=random.randint(1, 263),
+            DOLocationID=random.randint(1, 263),
+            trip_distance=round(random.uniform(0.5, 20.0), 2),
+            total_amount=round(random.uniform(5.0, 100.0), 2),
+            tpep_pickup_datetime=int(time.time() * 1000) if realtime else start_ms + i,
+        ))
+
+
+def add_loaded_at(conn, table):
+    """Add the loaded_at column to table; False if it already has one."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'loaded_at'
+        """, (table,))
+        if cur.fetchone():
+            conn.commit()
+            return False
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN loaded_at TIMESTAMPTZ DEFAULT clock_timestamp()')
+    conn.commit()
+    return True
+
+
+def drop_loaded_at(conn, table):
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS loaded_at')
+    conn.commit()
+
+
+def latency_percentiles(conn, table, start):
+    """p50, p95 and p99 seconds from pickup to insert of the rides since start."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP (
+                ORDER BY extract(epoch FROM (loaded_at AT TIME ZONE 'UTC') - pickup_datetime)
+            )
+            FROM {table}
+            WHERE pickup_datetime >= %s AND loaded_at IS NOT NULL
+        """, (start,))
+        percentiles = cur.fetchone()[0]
+    conn.commit()
+    return percentiles
+
+
+def main(job, rides, label, timeout, latency=False):
+    redpanda_port = os.getenv('REDPANDA_PORT', '9092')
+    conn = psycopg2.connect(
+        host='localhost',
+        port=5432,
+        database='postgres',
+        user='postgres',
+        password='postgres'
+    )
+    producer = create_producer(
+        bootstrap_servers=[f'localhost:{redpanda_port}'],
+        profile='throughput',
+        value_serializer=RIDE_CODEC.serializer('json'),
+    )
+
+    # Only a column this run added is dropped again, the sink tables keep
+    # their schema
+    added_loaded_at = latency and add_loaded_at(conn, LATENCY_TABLES[job])
+    try:
+        baseline = progress(conn, job)
+        start = first_pickup(conn, job)
+
+        started = time.time()
+        # Only the aggregation job needs event time to stay ahead of its watermark
+        send_rides(producer, rides, start, realtime=job != 'aggregation')
+        if job == 'aggregation':
+            # One ride two hours later moves the watermark past the last window
+            send_rides(producer, 1, start + timedelta(hours=2))
+        producer.flush()
+        sent = time.time() - started
+        print(f'Sent {rides} rides in {sent:.1f}s ({rides / sent:,.0f} rides/sec)')
+
+        arrived, last_arrival, last_change = 0, started, time.time()
+        while arrived < rides and time.time() - last_change < timeout:
+            time.sleep(0.5)
+            current = progress(conn, job) - baseline
+            if current != arrived:
+                arrived, last_arrival, last_change = current, time.time(), time.time()
+                print(f'  {arrived} rides in Postgres after {last_arrival - started:.1f}s')
+
+        elapsed = last_arrival - started
+        if arrived < rides:
+            print(f'Only {arrived} of {rides} rides arrived, no progress for {timeout:.0f}s')
+        print(f'{label or job}: {arrived} rides in {elapsed:.1f}s, {arrived / elapsed:,.0f} rides/sec end to end')
+        percentiles = latency_percentiles(conn, LATENCY_TABLES[job], start) if latency else None
+        if percentiles:
+            p50, p95, p99 = percentiles
+            print(f'{label or job}: latency p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms')
+    finally:
+        if added_loaded_at:
+            drop_loaded_at(conn, LATENCY_TABLES[job])
+        producer.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure rides/sec from Kafka into Postgres through a running job')
+    parser.add_argument('job', choices=sorted(PROGRESS_QUERIES), help='the job that is running')
+    parser.add_argument('--rides', type=int, default=100_000, help='rides to send')
+    parser.add_argument('--label', help='sink configuration name for the result line')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='stop waiting after this many seconds without new rows')
+    parser.add_argument('--latency', action='store_true',
+                        help='also report per-ride latency (pass_through and enriched_rides)')
+    args = parser.parse_args()
+    if args.latency and args.job not in LATENCY_TABLES:
+        parser.error(f'--latency needs one of {", ".join(sorted(LATENCY_TABLES))}')
+
+    main(args.job, args.rides, args.label, args.timeout, args.latency)
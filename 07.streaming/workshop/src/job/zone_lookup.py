@@ -0,0 +1,104 @@
+"""Zone name lookups for enriched_rides_job.py without the JDBC lookup join.
+
+- ZoneNames (--lookup full): scalar function that keeps the whole zones
+  table in every subtask, loaded in open() and reloaded in the background
+  every reload_interval seconds, so a lookup is always a dict get instead of
+  a Postgres round trip.
+- AsyncZoneLookup (--lookup async): async function that queries both zones
+  of a ride at once, with many rides in flight per subtask. For dimensions
+  too large to keep in memory. The pickup time stays epoch millis, converted
+  with TO_TIMESTAMP_LTZ in SQL like the other modes.
+
+Both need psycopg2/asyncpg in the Flink image (pyproject.flink.toml).
+"""
+import asyncio
+import threading
+import time
+
+from pyflink.common import Row
+from pyflink.datastream import AsyncFunction
+from pyflink.table.udf import ScalarFunction
+
+from postgres_copy_sink import POSTGRES
+
+
+class ZoneNames(ScalarFunction):
+
+    def __init__(self, reload_interval=3600):
+        self.reload_interval = reload_interval
+
+    def open(self, function_context):
+        self.zones = self.load()
+        self.loaded_at = time.monotonic()
+        self.reloading = None
+
+    def eval(self, location_id):
+        if time.monotonic() - self.loaded_at >= self.reload_interval and self.reloading is None:
+            # Rows keep using the current zones until the new ones are in
+            self.reloading = threading.Thread(target=self.reload, daemon=True)
+            self.reloading.start()
+        return self.zones.get(location_id)
+
+    def reload(self):
+        try:
+            self.zones = self.load()
+        except Exception as e:
+            print('Reloading the zones failed, keeping the previous ones:', str(e))
+        self.loaded_at = time.monotonic()
+        self.reloading = None
+
+    def load(self):
+        import psycopg2
+
+        conn = psycopg2.connect(**POSTGRES)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT location_id, zone FROM zones')
+                return dict(cur.fetchall())
+        finally:
+            conn.close()
+
+
+class AsyncZoneLookup(AsyncFunction):
+    """Enriches a ride row into the enriched_rides columns, with the pickup
+    time still in epoch millis.
+
+    Rides with an unknown zone are dropped, like the inner lookup join.
+    """
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+
+    def open(self, runtime_context):
+        self.pool = None
+        self.pool_lock = asyncio.Lock()
+
+    async def connection_pool(self):
+        async with self.pool_lock:
+            if self.pool is None:
+                import asyncpg
+
+                self.pool = await asyncpg.create_pool(**POSTGRES, min_size=1, max_size=self.pool_size)
+        return self.pool
+
+    async def async_invoke(self, ride):
+        pool = await self.connection_pool()
+        zones = dict(await pool.fetch(
+            'SELECT location_id, zone FROM zones WHERE location_id = ANY($1::int[])',
+            [ride.PULocationID, ride.DOLocationID],
+        ))
+        if ride.PULocationID not in zones or ride.DOLocationID not in zones:
+            return []
+        return [Row(
+            ride.PULocationID,
+            zones[ride.PULocationID],
+            ride.DOLocationID,
+            zones[ride.DOLocationID],
+            ride.trip_distance,
+            ride.total_amount,
+            ride.tpep_pickup_datetime,
+        )]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
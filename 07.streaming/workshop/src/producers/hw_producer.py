@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 import json
@@ -7,7 +8,11 @@ from pathlib import Path
 from dotenv import load_dotenv
 import dataclasses
 from dataclasses import dataclass
-from kafka import KafkaProducer
+from producer_factory import add_producer_arguments, create_producer, producer_overrides
+from serializers import FORMATS, RecordCodec, topic_format
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'common'))
+from download_cache import fetch
 
 load_dotenv()
 
@@ -34,17 +39,76 @@ def green_ride_from_row(row):
         total_amount=float(row['total_amount']),
     )
 
+GREEN_RIDE_CODEC = RecordCodec(GreenRide, {
+    'lpep_pickup_datetime': 'datetime',
+    'lpep_dropoff_datetime': 'datetime',
+    'PULocationID': 'int',
+    'DOLocationID': 'int',
+    'passenger_count': 'int',
+    'trip_distance': 'double',
+    'tip_amount': 'double',
+    'total_amount': 'double',
+}, schema_id=2)
+
 def green_ride_serializer(ride: GreenRide) -> bytes:
     return json.dumps(dataclasses.asdict(ride)).encode('utf-8')
 
 def green_ride_deserializer(data: bytes) -> GreenRide:
-    return GreenRide(**json.loads(data.decode('utf-8')))
-
-def load_producer():
+    # Accepts JSON as well as the binary and Avro formats
+    return GREEN_RIDE_CODEC.deserialize(data)
+
+GREEN_RIDE_FIELDS = [field.name for field in dataclasses.fields(GreenRide)]
+
+def green_rides_columns(dataframe):
+    """Column-wise version of green_ride_from_row for a whole DataFrame."""
+    columns = {}
+    for name in ['lpep_pickup_datetime', 'lpep_dropoff_datetime']:
+        columns[name] = pd.to_datetime(dataframe[name]).dt.strftime("%Y-%m-%d %H:%M:%S")
+    for name in ['PULocationID', 'DOLocationID']:
+        columns[name] = dataframe[name].astype('int64')
+
+    # iterrows() hands green_ride_from_row a Python int only when the column
+    # has an integer dtype; for a float column (months with missing values)
+    # every ride is sent with passenger_count 0
+    passenger_count = dataframe['passenger_count']
+    if pd.api.types.is_integer_dtype(passenger_count):
+        columns['passenger_count'] = passenger_count.fillna(0).astype('int64')
+    else:
+        columns['passenger_count'] = pd.Series(0, index=dataframe.index)
+
+    for name in ['trip_distance', 'tip_amount', 'total_amount']:
+        columns[name] = dataframe[name].astype('float64')
+    return columns
+
+def json_values(values):
+    # json.dumps over a whole column renders each value exactly as
+    # json.dumps(dataclasses.asdict(ride)) does, but in a single call
+    if not values:
+        return []
+    return json.dumps(values)[1:-1].split(', ')
+
+GREEN_RIDE_TEMPLATE = '{' + ', '.join(f'"{name}": %s' for name in GREEN_RIDE_FIELDS) + '}'
+
+def green_rides_serializer(dataframe, format='json') -> list:
+    """Serialize a DataFrame to the same bytes green_ride_serializer gives per row.
+
+    Other formats reuse the column-wise conversion and encode ride by ride.
+    """
+    columns = green_rides_columns(dataframe)
+    if format != 'json':
+        serialize = GREEN_RIDE_CODEC.serializer(format)
+        values = zip(*[columns[name].tolist() for name in GREEN_RIDE_FIELDS])
+        return [serialize(GreenRide(*ride)) for ride in values]
+    rendered = [json_values(columns[name].tolist()) for name in GREEN_RIDE_FIELDS]
+    return [(GREEN_RIDE_TEMPLATE % values).encode('utf-8') for values in zip(*rendered)]
+
+def load_producer(value_serializer=green_ride_serializer, profile='throughput', **overrides):
     redpanda_port = os.getenv('REDPANDA_PORT', '9092')
-    producer = KafkaProducer(
+    producer = create_producer(
         bootstrap_servers=[f'localhost:{redpanda_port}'],
-        value_serializer=green_ride_serializer,
+        profile=profile,
+        value_serializer=value_serializer,
+        **overrides,
     )
 
     url = "https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2025-10.parquet"
@@ -60,15 +124,8 @@ def load_producer():
         'total_amount',
     ]
 
-    local_path = Path(__file__).parent / 'data' / 'green_tripdata_2025-10.parquet'
-
-    if local_path.exists():
-        dataframe = pd.read_parquet(local_path, columns=columns)
-    else:
-        print('The file was not found locally, so it will be downloaded. This may take a few minutes...')
-        local_path.parent.mkdir(exist_ok=True)
-        dataframe = pd.read_parquet(url, columns=columns)
-        dataframe.to_parquet(local_path, index=False)
+    # Downloaded once into the shared cache, later runs read it from disk
+    dataframe = pd.read_parquet(fetch(url), columns=columns)
 
     return producer, dataframe
 
@@ -86,14 +143,53 @@ def main(producer, dataframe):
     end_time = time()
 
     print(f'The process took {(end_time - start_time):.2f} seconds')
+    print(f'{len(dataframe) / (end_time - start_time):.0f} messages/sec')
+
+def main_vectorized(producer, dataframe, batch_size=10_000, format='json'):
+    """Like main(), but rides are converted and serialized a batch at a time."""
+    topic_name = 'green-trips'
+
+    start_time = time()
+
+    for offset in range(0, len(dataframe), batch_size):
+        for value in green_rides_serializer(dataframe.iloc[offset:offset + batch_size], format):
+            producer.send(topic_name, value=value)
+
+    producer.flush()
+
+    end_time = time()
+
+    print(f'The process took {(end_time - start_time):.2f} seconds')
+    print(f'{len(dataframe) / (end_time - start_time):.0f} messages/sec')
 
 if __name__ == "__main__":
-    producer, dataframe = load_producer()
+    parser = argparse.ArgumentParser(description='Send the green taxi rides to Redpanda')
+    parser.add_argument('--vectorized', action='store_true',
+                        help='convert and serialize rides a batch at a time instead of row by row')
+    parser.add_argument('--batch-size', type=int, default=10_000,
+                        help='rides per batch in vectorized mode')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='wire format (default: the green-trips entry of serializers.TOPIC_FORMATS)')
+    add_producer_arguments(parser)
+    args = parser.parse_args()
+    format = topic_format('green-trips', args.format)
+
+    # In vectorized mode values are already bytes, so the producer must not
+    # serialize them again
+    producer, dataframe = load_producer(
+        value_serializer=None if args.vectorized else GREEN_RIDE_CODEC.serializer(format),
+        profile=args.profile,
+        **producer_overrides(args),
+    )
     print('Producer started. Sending data...')
 
     try:
-        main(producer, dataframe)
+        if args.vectorized:
+            main_vectorized(producer, dataframe, args.batch_size, format)
+        else:
+            main(producer, dataframe)
         print('All data was sent successfully!')
     except KeyboardInterrupt:
         producer.flush()
         print("\nProducer was stopped!")
+    producer.report()
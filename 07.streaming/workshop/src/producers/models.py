@@ -1,6 +1,7 @@
-import json
 from dataclasses import dataclass
 
+from serializers import RecordCodec
+
 
 @dataclass
 class Ride:
@@ -21,7 +22,15 @@ def ride_from_row(row):
     )
 
 
+RIDE_CODEC = RecordCodec(Ride, {
+    'PULocationID': 'int',
+    'DOLocationID': 'int',
+    'trip_distance': 'double',
+    'total_amount': 'double',
+    'tpep_pickup_datetime': 'long',
+}, schema_id=1)
+
+
 def ride_deserializer(data):
-    json_str = data.decode('utf-8')
-    ride_dict = json.loads(json_str)
-    return Ride(**ride_dict)
\ No newline at end of file
+    # Accepts JSON as well as the binary and Avro formats
+    return RIDE_CODEC.deserialize(data)
\ No newline at end of file
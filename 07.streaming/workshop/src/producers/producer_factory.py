@@ -0,0 +1,146 @@
+import threading
+from time import perf_counter
+
+from kafka import KafkaProducer
+
+# KafkaProducer settings for each profile. Only gzip compression is used since
+# lz4, snappy and zstd need extra Python packages.
+PROFILES = {
+    # Fill large batches and compress them, waiting up to 50 ms for a batch
+    'throughput': dict(
+        linger_ms=50,
+        batch_size=256 * 1024,
+        compression_type='gzip',
+        acks=1,
+        max_in_flight_requests_per_connection=5,
+    ),
+    # Send every record immediately
+    'latency': dict(
+        linger_ms=0,
+        batch_size=16 * 1024,
+        compression_type=None,
+        acks=1,
+        max_in_flight_requests_per_connection=5,
+    ),
+    # Wait for all in-sync replicas and keep ordering across retries
+    'durable': dict(
+        linger_ms=5,
+        batch_size=64 * 1024,
+        compression_type='gzip',
+        acks='all',
+        max_in_flight_requests_per_connection=1,
+        retries=10,
+    ),
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+class TrackedProducer:
+    """KafkaProducer wrapper that tracks the delivery of every record it sends.
+
+    send() and flush() can be used like the KafkaProducer ones; report()
+    prints the acked/failed counts and send-to-ack latency percentiles.
+    """
+
+    def __init__(self, producer, profile):
+        self.producer = producer
+        self.profile = profile
+        self.acked = 0
+        self.failed = 0
+        self.errors = []
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def send(self, topic, value=None, key=None):
+        sent_at = perf_counter()
+        future = self.producer.send(topic, value=value, key=key)
+        future.add_callback(self.on_success, sent_at)
+        future.add_errback(self.on_error)
+        return future
+
+    def on_success(self, sent_at, _metadata):
+        # Callbacks run in the producer's I/O thread
+        with self.lock:
+            self.acked += 1
+            self.latencies.append(perf_counter() - sent_at)
+
+    def on_error(self, exc):
+        with self.lock:
+            self.failed += 1
+            if len(self.errors) < 5:
+                self.errors.append(repr(exc))
+
+    def flush(self, timeout=None):
+        self.producer.flush(timeout=timeout)
+
+    def close(self, timeout=None):
+        self.producer.close(timeout=timeout)
+
+    def take_interval(self):
+        """(acked, failed, latencies) since the last call, for periodic stats.
+
+        Clears the collected latencies, so report() afterwards only covers the
+        rest of the run.
+        """
+        with self.lock:
+            interval = (self.acked, self.failed, self.latencies)
+            self.latencies = []
+        return interval
+
+    def report(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            acked, failed, errors = self.acked, self.failed, list(self.errors)
+
+        print(f'Profile {self.profile}: {acked} acked, {failed} failed')
+        if latencies:
+            print('Send-to-ack latency: ' + ', '.join(
+                f'p{p} {percentile(latencies, p) * 1000:.1f} ms' for p in (50, 95, 99)
+            ) + f', max {latencies[-1] * 1000:.1f} ms')
+        for error in errors:
+            print(f'  delivery error: {error}')
+
+
+def add_producer_arguments(parser, default_profile='throughput'):
+    """Add --profile and the per-setting overrides to an argparse parser."""
+    parser.add_argument('--profile', choices=sorted(PROFILES), default=default_profile,
+                        help='KafkaProducer settings profile')
+    parser.add_argument('--linger-ms', type=int, help='override the profile linger_ms')
+    parser.add_argument('--batch-bytes', type=int, help='override the profile batch_size (bytes)')
+    parser.add_argument('--compression', choices=['none', 'gzip', 'snappy', 'lz4', 'zstd'],
+                        help='override the profile compression_type')
+    parser.add_argument('--acks', choices=['0', '1', 'all'], help='override the profile acks')
+    parser.add_argument('--max-in-flight', type=int,
+                        help='override the profile max_in_flight_requests_per_connection')
+
+
+def producer_overrides(args):
+    """KafkaProducer settings given on the command line by add_producer_arguments()."""
+    overrides = {}
+    if args.linger_ms is not None:
+        overrides['linger_ms'] = args.linger_ms
+    if args.batch_bytes is not None:
+        overrides['batch_size'] = args.batch_bytes
+    if args.compression is not None:
+        overrides['compression_type'] = None if args.compression == 'none' else args.compression
+    if args.acks is not None:
+        overrides['acks'] = args.acks if args.acks == 'all' else int(args.acks)
+    if args.max_in_flight is not None:
+        overrides['max_in_flight_requests_per_connection'] = args.max_in_flight
+    return overrides
+
+
+def create_producer(bootstrap_servers, profile='throughput', value_serializer=None, **overrides):
+    """Build a TrackedProducer from one of PROFILES, with optional setting overrides."""
+    settings = {**PROFILES[profile], **overrides}
+    producer = KafkaProducer(
+        bootstrap_servers=bootstrap_servers,
+        value_serializer=value_serializer,
+        **settings,
+    )
+    return TrackedProducer(producer, profile)
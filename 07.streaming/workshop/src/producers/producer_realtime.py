@@ -1,15 +1,28 @@
-import dataclasses
-import json
+"""Send live rides to Redpanda.
+
+By default one ride every 0.5 s, ~20% of them 3-10 s late, printing each
+one. With --rate it becomes a load generator for the Flink jobs:
+
+    uv run python src/producers/producer_realtime.py --rate 50000 --processes 4 \\
+        --late-ratio 0.05 --delay-distribution exponential --duration 120
+
+Each process paces its share of the rate with a token bucket, and the main
+process prints the combined send/ack rates every few seconds.
+"""
+import argparse
+import multiprocessing
 import random
 import sys
 import time
 from datetime import datetime, timezone
+from itertools import accumulate
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from kafka import KafkaProducer
-from models import Ride
+from models import RIDE_CODEC, Ride
+from producer_factory import add_producer_arguments, create_producer, percentile, producer_overrides
+from serializers import FORMATS, topic_format
 
 # Top pickup locations from the actual NYC yellow taxi data.
 # PULocationID is a taxi zone ID (1-263) defined by the NYC TLC.
@@ -39,6 +52,12 @@ PICKUP_LOCATIONS = [
 
 DROPOFF_LOCATIONS = PICKUP_LOCATIONS  # same pool for simplicity
 
+# Every zone, most popular first: the list above, then the rest by ID
+ZONES_BY_POPULARITY = PICKUP_LOCATIONS + [z for z in range(1, 264) if z not in PICKUP_LOCATIONS]
+
+TOPIC = 'rides'
+SERVER = 'localhost:9092'
+
 
 def make_ride(delay_seconds=0):
     now_ms = int(time.time() * 1000) - delay_seconds * 1000
@@ -51,39 +70,218 @@ def make_ride(delay_seconds=0):
     )
 
 
-def ride_serializer(ride):
-    return json.dumps(dataclasses.asdict(ride)).encode('utf-8')
+def zipf_cum_weights(skew, zones=ZONES_BY_POPULARITY):
+    """Cumulative weights for random.choices: the zone of rank r gets 1 / r**skew.
+
+    skew 0 is uniform; around 1 the top 20 zones get about half the rides,
+    close to the real pickup distribution.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, len(zones) + 1)))
 
 
-server = 'localhost:9092'
-producer = KafkaProducer(
-    bootstrap_servers=[server],
-    value_serializer=ride_serializer,
-)
+def late_delays(count, late_ratio, distribution, min_delay, max_delay):
+    """Delay in milliseconds for each of count rides, 0 for the on-time ones."""
+    delays = []
+    for _ in range(count):
+        if random.random() >= late_ratio:
+            delays.append(0)
+        elif distribution == 'uniform' or max_delay == min_delay:
+            delays.append(int(random.uniform(min_delay, max_delay) * 1000))
+        else:
+            # Mostly slightly late, with a tail up to max_delay
+            delay = min_delay + random.expovariate(3 / (max_delay - min_delay))
+            delays.append(int(min(delay, max_delay) * 1000))
+    return delays
 
-topic_name = 'rides'
-count = 0
 
-print("Sending events (Ctrl+C to stop)...")
-print()
+def make_rides(count, cum_weights, late_ratio, distribution, min_delay, max_delay):
+    now_ms = int(time.time() * 1000)
+    pickups = random.choices(ZONES_BY_POPULARITY, cum_weights=cum_weights, k=count)
+    dropoffs = random.choices(ZONES_BY_POPULARITY, cum_weights=cum_weights, k=count)
+    delays = late_delays(count, late_ratio, distribution, min_delay, max_delay)
+    return [
+        Ride(
+            PULocationID=pickup,
+            DOLocationID=dropoff,
+            trip_distance=round(random.uniform(0.5, 20.0), 2),
+            total_amount=round(random.uniform(5.0, 100.0), 2),
+            tpep_pickup_datetime=now_ms - delay,
+        )
+        for pickup, dropoff, delay in zip(pickups, dropoffs, delays)
+    ], sum(1 for delay in delays if delay)
 
-try:
-    while True:
-        # ~20% chance of a late event (3-10 seconds old)
-        if random.random() < 0.2:
-            delay = random.randint(3, 10)
-            ride = make_ride(delay_seconds=delay)
-            ts = datetime.fromtimestamp(ride.tpep_pickup_datetime / 1000, tz=timezone.utc)
-            print(f"  LATE ({delay}s) -> PU={ride.PULocationID} ts={ts:%H:%M:%S}")
-        else:
-            ride = make_ride()
-            ts = datetime.fromtimestamp(ride.tpep_pickup_datetime / 1000, tz=timezone.utc)
-            print(f"  on time   -> PU={ride.PULocationID} ts={ts:%H:%M:%S}")
 
-        producer.send(topic_name, value=ride)
-        count += 1
-        time.sleep(0.5)
+def generate(worker, rate, args, stats):
+    """One producer process: send rate rides/sec until args.duration or Ctrl+C.
+
+    Puts (worker, sent, late, acked, failed, latencies, finished) on stats
+    every args.stats_interval seconds, and once more at the end.
+    """
+    def put_stats(finished):
+        acked, failed, latencies = producer.take_interval() if producer is not None else (0, 0, [])
+        # A sample of the latencies is enough for the percentiles
+        stats.put((worker, sent, late, acked, failed, latencies[::len(latencies) // 10_000 + 1], finished))
+
+    cum_weights = zipf_cum_weights(args.skew)
+
+    # Token bucket: refilled at rate tokens/sec, one token per ride, holding
+    # at most 100 ms worth so a stall is not followed by a burst
+    capacity = max(1.0, rate / 10)
+    tokens = 0.0
+    sent = late = 0
+    producer = None
+    try:
+        # Inside the try, so main_load still gets this worker's final stats
+        # if the producer cannot be created
+        producer = create_producer(
+            bootstrap_servers=[SERVER],
+            profile=args.profile,
+            value_serializer=RIDE_CODEC.serializer(topic_format(TOPIC, args.format)),
+            **producer_overrides(args),
+        )
+        started = last_refill = last_stats = time.monotonic()
+        while not args.duration or time.monotonic() - started < args.duration:
+            now = time.monotonic()
+            tokens = min(capacity, tokens + (now - last_refill) * rate)
+            last_refill = now
+            if tokens < 1:
+                time.sleep((1 - tokens) / rate)
+                continue
+
+            batch = int(tokens)
+            tokens -= batch
+            rides, batch_late = make_rides(batch, cum_weights, args.late_ratio, args.delay_distribution,
+                                           args.min_delay, args.max_delay)
+            for ride in rides:
+                producer.send(TOPIC, value=ride)
+            sent += batch
+            late += batch_late
+
+            if now - last_stats >= args.stats_interval:
+                put_stats(False)
+                last_stats = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            if producer is not None:
+                producer.flush()
+        finally:
+            put_stats(True)
+            if producer is not None:
+                producer.close()
+
+
+def main_load(args):
+    """Start args.processes generators and print their combined stats."""
+    stats = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=generate, args=(worker, args.rate / args.processes, args, stats))
+        for worker in range(args.processes)
+    ]
+    for process in workers:
+        process.start()
+
+    print(f'Sending {args.rate:,.0f} rides/sec from {args.processes} processes (Ctrl+C to stop)...')
+    started = last_print = time.monotonic()
+    totals = {}  # worker -> (sent, late, acked, failed)
+    previous = (0, 0)
+    latencies = []
+    done = set()
+    while len(done) < args.processes:
+        try:
+            worker, sent, late, acked, failed, worker_latencies, finished = stats.get()
+        except KeyboardInterrupt:
+            # Ctrl+C reaches the workers too; wait for their final stats
+            continue
+        totals[worker] = (sent, late, acked, failed)
+        latencies.extend(worker_latencies)
+        if finished:
+            done.add(worker)
+
+        now = time.monotonic()
+        if now - last_print >= args.stats_interval or len(done) == args.processes:
+            sent, late, acked, failed = (sum(t[i] for t in totals.values()) for i in range(4))
+            interval = now - last_print
+            latencies.sort()
+            print(f'[{now - started:6.1f}s] sent {(sent - previous[0]) / interval:,.0f}/s, '
+                  f'acked {(acked - previous[1]) / interval:,.0f}/s, '
+                  f'behind target {max(0, args.rate * (now - started) - sent):,.0f}, '
+                  f'in flight {sent - acked - failed:,}, failed {failed}, late {late:,}, '
+                  f'ack p50 {percentile(latencies, 50) * 1000:.1f} ms p99 {percentile(latencies, 99) * 1000:.1f} ms')
+            previous = (sent, acked)
+            last_print = now
+            latencies = []
+
+    for process in workers:
+        process.join()
+    elapsed = time.monotonic() - started
+    sent, late, acked, failed = (sum(t[i] for t in totals.values()) for i in range(4))
+    print(f'\nSent {sent:,} events ({late:,} late) in {elapsed:.1f}s, {sent / elapsed:,.0f}/s; '
+          f'{acked:,} acked, {failed} failed')
+
+
+def main_interactive(args):
+    producer = create_producer(
+        bootstrap_servers=[SERVER],
+        profile=args.profile,
+        value_serializer=RIDE_CODEC.serializer(topic_format(TOPIC, args.format)),
+        **producer_overrides(args),
+    )
+
+    count = 0
+
+    print("Sending events (Ctrl+C to stop)...")
+    print()
+
+    try:
+        while True:
+            # ~20% chance of a late event (3-10 seconds old)
+            if random.random() < 0.2:
+                delay = random.randint(3, 10)
+                ride = make_ride(delay_seconds=delay)
+                ts = datetime.fromtimestamp(ride.tpep_pickup_datetime / 1000, tz=timezone.utc)
+                print(f"  LATE ({delay}s) -> PU={ride.PULocationID} ts={ts:%H:%M:%S}")
+            else:
+                ride = make_ride()
+                ts = datetime.fromtimestamp(ride.tpep_pickup_datetime / 1000, tz=timezone.utc)
+                print(f"  on time   -> PU={ride.PULocationID} ts={ts:%H:%M:%S}")
+
+            producer.send(TOPIC, value=ride)
+            count += 1
+            time.sleep(0.5)
+
+    except KeyboardInterrupt:
+        producer.flush()
+        print(f"\nSent {count} events")
+        producer.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send live rides to Redpanda',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--format', choices=FORMATS,
+                        help='wire format (default: the rides entry of serializers.TOPIC_FORMATS)')
+    add_producer_arguments(parser, default_profile='latency')
+
+    load = parser.add_argument_group('load generator (--rate)')
+    load.add_argument('--rate', type=float,
+                      help='target rides/sec over all processes; without it, one ride every 0.5 s')
+    load.add_argument('--processes', type=int, default=1, help='producer processes')
+    load.add_argument('--duration', type=float, default=0, help='seconds to run (0: until Ctrl+C)')
+    load.add_argument('--late-ratio', type=float, default=0.2, help='fraction of rides sent late')
+    load.add_argument('--delay-distribution', choices=['uniform', 'exponential'], default='uniform',
+                      help='how late the late rides are, between --min-delay and --max-delay')
+    load.add_argument('--min-delay', type=float, default=3, help='seconds')
+    load.add_argument('--max-delay', type=float, default=10, help='seconds')
+    load.add_argument('--skew', type=float, default=1.0,
+                      help='Zipf exponent of the PULocationID/DOLocationID popularity (0: uniform)')
+    load.add_argument('--stats-interval', type=float, default=5, help='seconds between stats lines')
+    args = parser.parse_args()
+    if args.max_delay < args.min_delay:
+        parser.error('--max-delay must not be below --min-delay')
 
-except KeyboardInterrupt:
-    producer.flush()
-    print(f"\nSent {count} events")
+    if args.rate:
+        main_load(args)
+    else:
+        main_interactive(args)
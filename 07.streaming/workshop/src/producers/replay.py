@@ -0,0 +1,174 @@
+"""Replay a TLC trip month to Redpanda, paced by the pickup timestamps.
+
+    uv run python src/producers/replay.py green 2025-10 --speed 60
+    uv run python src/producers/replay.py yellow 2025-01 --speed max
+
+Green trips go to green-trips as GreenRide, yellow trips to rides as Ride,
+with their original pickup times, so every replay of a month produces the
+same events in the same order. The file is read in record batches and
+never loaded whole.
+
+With --speed 60 an hour of pickups is sent in a minute; --speed max sends
+as fast as the producer allows. The replay clock follows the latest pickup
+seen so far, so rides that are out of order in the file are sent right
+away and arrive late, as they would from the taxis. Rides picked up
+outside the month (a few in every TLC file) are skipped.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import monotonic, sleep
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from hw_producer import green_rides_serializer
+from models import RIDE_CODEC, Ride
+from producer_factory import add_producer_arguments, create_producer, producer_overrides
+from serializers import FORMATS, topic_format
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'common'))
+from download_cache import fetch
+
+URL = 'https://d37ci6vzurychx.cloudfront.net/trip-data/{taxi_type}_tripdata_{month}.parquet'
+
+TOPICS = {'green': 'green-trips', 'yellow': 'rides'}
+
+PICKUP_COLUMNS = {'green': 'lpep_pickup_datetime', 'yellow': 'tpep_pickup_datetime'}
+
+COLUMNS = {
+    'green': [
+        'lpep_pickup_datetime',
+        'lpep_dropoff_datetime',
+        'PULocationID',
+        'DOLocationID',
+        'passenger_count',
+        'trip_distance',
+        'tip_amount',
+        'total_amount',
+    ],
+    'yellow': ['PULocationID', 'DOLocationID', 'trip_distance', 'total_amount', 'tpep_pickup_datetime'],
+}
+
+
+def yellow_rides_serializer(dataframe, format='json'):
+    serialize = RIDE_CODEC.serializer(format)
+    pickups = dataframe['tpep_pickup_datetime'].astype('datetime64[ms]').astype('int64')
+    return [
+        serialize(Ride(*values))
+        for values in zip(
+            dataframe['PULocationID'].astype('int64').tolist(),
+            dataframe['DOLocationID'].astype('int64').tolist(),
+            dataframe['trip_distance'].astype('float64').tolist(),
+            dataframe['total_amount'].astype('float64').tolist(),
+            pickups.tolist(),
+        )
+    ]
+
+
+SERIALIZERS = {'green': green_rides_serializer, 'yellow': yellow_rides_serializer}
+
+
+def month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return np.datetime64(start, 'ms'), np.datetime64(end, 'ms')
+
+
+def read_batches(path, taxi_type, month, batch_size):
+    """Yield (DataFrame, pickup epoch ms) per record batch, rides outside month removed."""
+    start, end = month_bounds(month)
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=COLUMNS[taxi_type]):
+        dataframe = batch.to_pandas()
+        pickups = dataframe[PICKUP_COLUMNS[taxi_type]].to_numpy().astype('datetime64[ms]')
+        in_month = (pickups >= start) & (pickups < end)
+        if not in_month.all():
+            dataframe = dataframe[in_month]
+            pickups = pickups[in_month]
+        yield dataframe, pickups.astype('int64')
+
+
+def replay(producer, batches, topic, serialize, format, speed, stats_interval=5.0):
+    """Send the batches to topic, speed times faster than real time (None: no pacing)."""
+    sent = 0
+    first_pickup = replay_clock = None
+    started = last_stats = monotonic()
+
+    for dataframe, pickups in batches:
+        if not len(pickups):
+            continue
+        values = serialize(dataframe, format)
+
+        if first_pickup is None:
+            first_pickup = replay_clock = int(pickups[0])
+        # Send time of each ride in seconds after the start: the latest pickup
+        # so far, compressed by speed
+        clock = np.maximum.accumulate(np.maximum(pickups, replay_clock))
+        replay_clock = int(clock[-1])
+        due = (clock - first_pickup) / 1000 / speed if speed else None
+
+        position = 0
+        while position < len(values):
+            if due is None:
+                end = len(values)
+            else:
+                elapsed = monotonic() - started
+                end = int(np.searchsorted(due, elapsed, side='right'))
+                if end == position:
+                    sleep(min(due[position] - elapsed, stats_interval))
+                    continue
+            for value in values[position:end]:
+                producer.send(topic, value=value)
+            sent += end - position
+            position = end
+
+            now = monotonic()
+            if now - last_stats >= stats_interval:
+                print(f'[{now - started:6.1f}s] {sent:,} rides, {sent / (now - started):,.0f}/s, '
+                      f'replay clock {np.datetime64(replay_clock, "ms")}')
+                last_stats = now
+
+    producer.flush()
+    elapsed = monotonic() - started
+    print(f'Replayed {sent:,} rides in {elapsed:.1f}s ({sent / elapsed:,.0f} rides/sec)')
+
+
+def speed_type(value):
+    return None if value == 'max' else float(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a TLC trip month to Redpanda',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('taxi_type', choices=sorted(TOPICS))
+    parser.add_argument('month', help='YYYY-MM')
+    parser.add_argument('--file', help='local Parquet file instead of downloading the month')
+    parser.add_argument('--speed', type=speed_type, default=60.0,
+                        help="time compression factor, or 'max' for as fast as possible")
+    parser.add_argument('--topic', help='default: green-trips for green, rides for yellow')
+    parser.add_argument('--batch-size', type=int, default=10_000, help='rides per Parquet record batch')
+    parser.add_argument('--format', choices=FORMATS, help='wire format (default: from serializers.TOPIC_FORMATS)')
+    add_producer_arguments(parser)
+    args = parser.parse_args()
+
+    topic = args.topic or TOPICS[args.taxi_type]
+    path = args.file or fetch(URL.format(taxi_type=args.taxi_type, month=args.month))
+
+    # Values are serialized a batch at a time, so the producer sends bytes
+    redpanda_port = os.getenv('REDPANDA_PORT', '9092')
+    producer = create_producer(
+        bootstrap_servers=[f'localhost:{redpanda_port}'],
+        profile=args.profile,
+        **producer_overrides(args),
+    )
+    print(f'Replaying {path} to {topic} at {"max speed" if args.speed is None else f"{args.speed:g}x"}...')
+    try:
+        replay(producer, read_batches(path, args.taxi_type, args.month, args.batch_size), topic,
+               SERIALIZERS[args.taxi_type], topic_format(topic, args.format), args.speed)
+    except KeyboardInterrupt:
+        producer.flush()
+        print('\nReplay was stopped!')
+    producer.report()
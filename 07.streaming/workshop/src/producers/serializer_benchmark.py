@@ -0,0 +1,81 @@
+"""Compare the wire formats in serializers.py for Ride and GreenRide.
+
+Prints bytes/message and encode/decode throughput per format, on synthetic
+rides shaped like the ones the producers send:
+
+    uv run python src/producers/serializer_benchmark.py --count 100000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from hw_producer import GREEN_RIDE_CODEC, GreenRide
+from models import RIDE_CODEC, Ride
+from serializers import FORMATS
+
+
+def make_rides(count):
+    start_ms = 1_760_000_000_000
+    return [
+        Ride(
+            PULocationID=random.randint(1, 265),
+            DOLocationID=random.randint(1, 265),
+            trip_distance=round(random.uniform(0.5, 20.0), 2),
+            total_amount=round(random.uniform(5.0, 100.0), 2),
+            tpep_pickup_datetime=start_ms + random.randint(0, 86_400_000),
+        )
+        for _ in range(count)
+    ]
+
+
+def make_green_rides(count):
+    start = datetime(2025, 10, 1)
+    rides = []
+    for _ in range(count):
+        pickup = start + timedelta(seconds=random.randint(0, 31 * 86_400))
+        dropoff = pickup + timedelta(seconds=random.randint(60, 3_600))
+        rides.append(GreenRide(
+            lpep_pickup_datetime=pickup.strftime("%Y-%m-%d %H:%M:%S"),
+            lpep_dropoff_datetime=dropoff.strftime("%Y-%m-%d %H:%M:%S"),
+            PULocationID=random.randint(1, 265),
+            DOLocationID=random.randint(1, 265),
+            passenger_count=random.randint(0, 6),
+            trip_distance=random.uniform(0.1, 30.0),
+            tip_amount=round(random.uniform(0, 15), 2),
+            total_amount=round(random.uniform(5, 150), 2),
+        ))
+    return rides
+
+
+def benchmark(codec, records):
+    print(f'{codec.record_type.__name__} ({len(records)} messages)')
+    print(f'  {"format":<8} {"bytes/msg":>10} {"encode msg/s":>14} {"decode msg/s":>14}')
+    for format in FORMATS:
+        serialize = codec.serializer(format)
+
+        start = perf_counter()
+        encoded = [serialize(record) for record in records]
+        encode_time = perf_counter() - start
+
+        start = perf_counter()
+        decoded = [codec.deserialize(data) for data in encoded]
+        decode_time = perf_counter() - start
+
+        if decoded != records:
+            raise AssertionError(f'{format} does not round-trip {codec.record_type.__name__}')
+
+        size = sum(len(data) for data in encoded) / len(encoded)
+        print(f'  {format:<8} {size:>10.1f} {len(records) / encode_time:>14,.0f} '
+              f'{len(records) / decode_time:>14,.0f}')
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Kafka message formats')
+    parser.add_argument('--count', type=int, default=100_000, help='messages per record type')
+    args = parser.parse_args()
+
+    random.seed(42)
+    benchmark(RIDE_CODEC, make_rides(args.count))
+    benchmark(GREEN_RIDE_CODEC, make_green_rides(args.count))
@@ -0,0 +1,112 @@
+"""The windowed PyFlink jobs, run by the embedded engine instead of a cluster.
+
+    uv run python src/stream_engine/jobs.py aggregation
+    uv run python src/stream_engine/jobs.py tips_per_hour --bounded
+
+Each job reads its topic from the earliest offset, as the Flink jobs do, and
+upserts into the table the Flink job writes (see src/postgres_tables/).
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'producers'))
+from hw_producer import GREEN_RIDE_CODEC
+from models import RIDE_CODEC
+from serializers import datetime_to_millis
+
+from engine import HOUR, MINUTE, Job, PostgresUpsertSink, Session, Tumble, run
+
+
+def green_pickup_time(ride):
+    return datetime_to_millis(ride.lpep_pickup_datetime)
+
+
+def ride_pickup_time(ride):
+    return ride.tpep_pickup_datetime
+
+
+JOBS = {
+    # aggregation_job.py
+    'aggregation': Job(
+        topic='rides',
+        codec=RIDE_CODEC,
+        event_time=ride_pickup_time,
+        window=Tumble(HOUR),
+        key='PULocationID',
+        aggregates={'num_trips': ('count', None), 'total_revenue': ('sum', 'total_amount')},
+        table='processed_events_aggregated',
+    ),
+    # aggregated_pickup_job.py
+    'pickup': Job(
+        topic='green-trips',
+        codec=GREEN_RIDE_CODEC,
+        event_time=green_pickup_time,
+        window=Tumble(5 * MINUTE),
+        key='PULocationID',
+        aggregates={'num_trips': ('count', None)},
+        table='pickup_aggregated',
+    ),
+    # aggregated_longest_streak_job.py
+    'longest_streak': Job(
+        topic='green-trips',
+        codec=GREEN_RIDE_CODEC,
+        event_time=green_pickup_time,
+        window=Session(5 * MINUTE),
+        key='PULocationID',
+        aggregates={'num_trips': ('count', None)},
+        table='longest_streak_aggregated',
+        window_columns=('window_start', 'window_end'),
+    ),
+    # aggregated_tips_per_hour_job.py
+    'tips_per_hour': Job(
+        topic='green-trips',
+        codec=GREEN_RIDE_CODEC,
+        event_time=green_pickup_time,
+        window=Tumble(HOUR),
+        key=None,
+        aggregates={'total_tips': ('sum', 'tip_amount')},
+        table='tips_per_hour_aggregated',
+    ),
+}
+
+
+if __name__ == '__main__':
+    import psycopg2
+    from kafka import KafkaConsumer, TopicPartition
+
+    parser = argparse.ArgumentParser(description='Run a windowed aggregation job without Flink')
+    parser.add_argument('job', choices=sorted(JOBS))
+    parser.add_argument('--bounded', action='store_true',
+                        help='stop at the current end of the topic and fire all open windows')
+    parser.add_argument('--max-records', type=int, default=5000, help='messages per poll')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per upsert batch')
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                        help='seconds before a partial upsert batch is written')
+    args = parser.parse_args()
+    job = JOBS[args.job]
+
+    redpanda_port = os.getenv('REDPANDA_PORT', '9092')
+    # No consumer group: every run starts from the earliest offset like the
+    # Flink jobs, so windows are rebuilt completely and the upserts are
+    # idempotent
+    consumer = KafkaConsumer(bootstrap_servers=[f'localhost:{redpanda_port}'], enable_auto_commit=False)
+    partitions = [TopicPartition(job.topic, p) for p in sorted(consumer.partitions_for_topic(job.topic))]
+    consumer.assign(partitions)
+    consumer.seek_to_beginning(*partitions)
+
+    conn = psycopg2.connect(
+        host='localhost',
+        port=5432,
+        database='postgres',
+        user='postgres',
+        password='postgres'
+    )
+    sink = PostgresUpsertSink(conn, job, batch_size=args.batch_size, flush_interval=args.flush_interval)
+
+    print(f'Aggregating {job.topic} into {job.table} ({len(partitions)} partitions)...')
+    run(consumer, partitions, job, sink, bounded=args.bounded, max_records=args.max_records)
+
+    consumer.close()
+    conn.close()
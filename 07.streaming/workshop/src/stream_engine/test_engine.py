@@ -0,0 +1,118 @@
+"""End-to-end checks of the engine on the in-process broker of fake_broker.py.
+
+    uv run --with pytest pytest src/stream_engine
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JOBS
+from engine import MINUTE, Hop, Job
+from fake_broker import FakeBroker, expected_rows, run_job, same_rows
+from hw_producer import GREEN_RIDE_CODEC, GreenRide
+from models import RIDE_CODEC, Ride
+
+START = datetime(2025, 10, 1)
+
+PICKUP_HOPPING = Job(
+    topic='green-trips',
+    codec=GREEN_RIDE_CODEC,
+    event_time=JOBS['pickup'].event_time,
+    window=Hop(10 * MINUTE, 5 * MINUTE),
+    key='PULocationID',
+    aggregates={'num_trips': ('count', None), 'total_tips': ('sum', 'tip_amount')},
+    table='pickup_hopping',
+)
+
+
+def green_ride(pickup):
+    return GreenRide(
+        lpep_pickup_datetime=pickup.isoformat(sep=' '),
+        lpep_dropoff_datetime=(pickup + timedelta(minutes=10)).isoformat(sep=' '),
+        PULocationID=42,
+        DOLocationID=1,
+        passenger_count=1,
+        trip_distance=1.0,
+        tip_amount=1.0,
+        total_amount=10.0,
+    )
+
+
+@pytest.fixture(scope='module')
+def generated():
+    random.seed(7)
+    broker = FakeBroker(partitions=3)
+    green_rides, rides = [], []
+    for i in range(30_000):
+        # Mostly increasing event time, up to 4 s out of order (within the
+        # 5 s lateness), with a 20 minute pause every 2000 rides so sessions
+        # close; spread over 3 partitions in JSON and binary
+        ts = START + timedelta(seconds=i * 0.5 + (i // 2000) * 1200 + random.uniform(-4, 0))
+        pickup = ts.replace(microsecond=0)
+        green = GreenRide(
+            lpep_pickup_datetime=pickup.isoformat(sep=' '),
+            lpep_dropoff_datetime=(pickup + timedelta(minutes=10)).isoformat(sep=' '),
+            PULocationID=random.choice([7, 42, 74, 75, 166]),
+            DOLocationID=random.randint(1, 265),
+            passenger_count=random.randint(0, 4),
+            trip_distance=round(random.uniform(0.5, 20), 2),
+            tip_amount=round(random.uniform(0, 10), 2),
+            total_amount=round(random.uniform(5, 80), 2),
+        )
+        ride = Ride(
+            PULocationID=green.PULocationID,
+            DOLocationID=green.DOLocationID,
+            trip_distance=green.trip_distance,
+            total_amount=green.total_amount,
+            tpep_pickup_datetime=int((ts - START).total_seconds() * 1000) + 1_759_276_800_000,
+        )
+        format = 'binary' if i % 2 else 'json'
+        partition = i % 3
+        broker.produce('green-trips', GREEN_RIDE_CODEC.serializer(format)(green), partition)
+        broker.produce('rides', RIDE_CODEC.serializer(format)(ride), partition)
+        green_rides.append(green)
+        rides.append(ride)
+    return broker, green_rides, rides
+
+
+@pytest.mark.parametrize('name, job, windows', [
+    ('aggregation', JOBS['aggregation'], 48),
+    ('pickup', JOBS['pickup'], 313),
+    ('longest_streak', JOBS['longest_streak'], 75),
+    ('tips_per_hour', JOBS['tips_per_hour'], 10),
+    ('pickup_hopping', PICKUP_HOPPING, 388),
+])
+def test_job_matches_brute_force(generated, name, job, windows):
+    broker, green_rides, rides = generated
+    rows, late = run_job(broker, job)
+
+    assert late == 0
+    assert len(rows) == windows
+    assert same_rows(rows, expected_rows(job, rides if job.topic == 'rides' else green_rides))
+
+
+def test_late_record_is_dropped():
+    broker = FakeBroker()
+    # More than one poll, so the watermark moves on before the last record
+    for minute in range(1000):
+        broker.produce('green-trips', GREEN_RIDE_CODEC.to_json(green_ride(START + timedelta(minutes=minute))))
+    # Far behind the watermark, as in Flink
+    broker.produce('green-trips', GREEN_RIDE_CODEC.to_json(green_ride(START)))
+
+    rows, late = run_job(broker, JOBS['pickup'])
+    assert late == 1
+    assert len(rows) == 200
+
+
+def test_sessions_one_gap_apart_merge():
+    broker = FakeBroker()
+    gap = timedelta(milliseconds=JOBS['longest_streak'].window.gap)
+    # Exactly one gap apart, then one gap and a second: [0, 2 gaps) and a new session
+    for pickup in (START, START + gap, START + 3 * gap + timedelta(seconds=1)):
+        broker.produce('green-trips', GREEN_RIDE_CODEC.to_json(green_ride(pickup)))
+
+    rows, late = run_job(broker, JOBS['longest_streak'])
+    assert late == 0
+    assert sorted(row[-1] for row in rows.values()) == [1, 2]
+    assert (START, START + 2 * gap) in {row[:2] for row in rows.values()}
@@ -0,0 +1,256 @@
+"""On-disk cache for the TLC monthly files, shared by the ingestion scripts.
+
+Every script used to download the same months its own way. They now call
+fetch(url), which returns a local path and only goes to the network when the
+file is not cached yet.
+
+Layout under the cache root (TLC_CACHE_DIR, default ~/.cache/nyc-tlc):
+
+    entries/<url key>.json        url, ETag, Last-Modified, size, blob, last use
+    blobs/<content key>-<name>    complete files, keyed by URL + ETag + size
+    partial/<url key>-<name>.part interrupted downloads, resumed with Range
+
+Only the standard library is used, so any of the course projects can import
+it without extra dependencies.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+DEFAULT_CACHE_DIR = Path(os.getenv('TLC_CACHE_DIR', Path.home() / '.cache' / 'nyc-tlc'))
+DEFAULT_MAX_BYTES = int(os.getenv('TLC_CACHE_MAX_BYTES', 50 * 1024 ** 3))
+# Files used more recently than this are never evicted: fetch() returns a path
+# that its caller has not opened yet
+DEFAULT_MIN_AGE = 10 * 60
+CHUNK_SIZE = 1024 * 1024
+
+
+def _key(*parts):
+    return hashlib.sha256('\n'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class DownloadCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, chunk_size=CHUNK_SIZE,
+                 timeout=60, min_age=DEFAULT_MIN_AGE):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        for name in ('entries', 'blobs', 'partial', 'locks'):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, url, revalidate=False, expected_size=None):
+        """Return the local path of url, downloading it if needed.
+
+        A cached file is returned without any request unless revalidate is
+        set, in which case a conditional GET (If-None-Match/If-Modified-Since)
+        checks that it is still current. expected_size (e.g. the Content-Length
+        of a HEAD request) is checked against both cached and new downloads.
+        """
+        url_key = _key(url)
+        with self._lock(url_key):
+            entry_path = self.root / 'entries' / f'{url_key}.json'
+            entry = _read_json(entry_path)
+            blob = self.root / 'blobs' / entry['blob'] if entry else None
+
+            if blob is not None and expected_size is not None and entry['size'] != expected_size:
+                print(f"Cached {entry['blob']} has {entry['size']} bytes, expected {expected_size}")
+                blob.unlink(missing_ok=True)
+                entry_path.unlink(missing_ok=True)
+                entry = blob = None
+
+            if blob is not None and blob.exists():
+                if not revalidate:
+                    self._touch(entry_path, entry)
+                    return blob
+                path = self._download(url, url_key, entry_path, cached=entry,
+                                      expected_size=expected_size)
+            else:
+                path = self._download(url, url_key, entry_path, expected_size=expected_size)
+
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits max_bytes.
+
+        Files whose URL is being fetched (its lock is held) or that were used
+        in the last min_age seconds are skipped.
+        """
+        entries = []
+        for entry_path in (self.root / 'entries').glob('*.json'):
+            entry = _read_json(entry_path)
+            if entry:
+                entries.append((entry.get('last_used', 0), entry_path, entry))
+
+        total = sum(entry['size'] for _, _, entry in entries)
+        for _, entry_path, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            with self._lock(entry_path.stem, blocking=False) as lock:
+                if not lock.locked:
+                    continue
+                # Read again: another process may have used or replaced it
+                entry = _read_json(entry_path)
+                if entry is None:
+                    continue
+                blob = self.root / 'blobs' / entry['blob']
+                if blob == keep or time.time() - entry.get('last_used', 0) < self.min_age:
+                    continue
+                blob.unlink(missing_ok=True)
+                entry_path.unlink(missing_ok=True)
+            total -= entry['size']
+            print(f"Evicted {entry['url']} from the download cache")
+
+    def _touch(self, entry_path, entry):
+        entry['last_used'] = time.time()
+        _write_json(entry_path, entry)
+
+    def _download(self, url, url_key, entry_path, cached=None, expected_size=None):
+        """Download url into the cache, resuming a partial file if there is one.
+
+        With a cached entry the request is conditional and a 304 answer keeps
+        the cached file; a 200 answer replaces it in the same request.
+        """
+        name = url.rsplit('/', 1)[-1].split('?')[0] or 'download'
+        part = self.root / 'partial' / f'{url_key}-{name}.part'
+        part_meta_path = part.with_name(part.name + '.json')
+        part_meta = _read_json(part_meta_path) or {}
+
+        offset = part.stat().st_size if part.exists() else 0
+        if expected_size is not None and offset > expected_size:
+            offset = 0
+        headers = {}
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        if offset and validator:
+            # If-Range makes the server send the whole file again if it changed
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self._touch(entry_path, cached)
+                return self.root / 'blobs' / cached['blob']
+            if e.code != 416:
+                raise
+            # The partial file no longer matches the remote one, start over
+            part.unlink(missing_ok=True)
+            response = urllib.request.urlopen(url, timeout=self.timeout)
+            offset = 0
+
+        with response:
+            if response.status == 206:
+                size = int(response.headers['Content-Range'].rsplit('/', 1)[1])
+                print(f'Resuming {name} at {offset / 1024 ** 2:.1f} MiB')
+            else:
+                offset = 0
+                length = response.headers.get('Content-Length')
+                size = int(length) if length else None
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            _write_json(part_meta_path, {'etag': etag, 'last_modified': last_modified})
+
+            with open(part, 'ab' if offset else 'wb') as f:
+                shutil.copyfileobj(response, f, length=self.chunk_size)
+
+        written = part.stat().st_size
+        if size is None:
+            size = expected_size
+        elif expected_size is not None and size != expected_size:
+            raise IOError(f'{url} is {size} bytes, expected {expected_size}')
+        if size is not None and written != size:
+            raise IOError(f'Incomplete download of {url}: {written} of {size} bytes, rerun to resume')
+
+        blob_name = f'{_key(url, etag, written)}-{name}'
+        blob = self.root / 'blobs' / blob_name
+        os.replace(part, blob)
+        part_meta_path.unlink(missing_ok=True)
+        if cached is not None and cached['blob'] != blob_name:
+            (self.root / 'blobs' / cached['blob']).unlink(missing_ok=True)
+
+        _write_json(entry_path, {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': written,
+            'blob': blob_name,
+            'last_used': time.time(),
+        })
+        return blob
+
+    def _lock(self, url_key, blocking=True):
+        return _FileLock(self.root / 'locks' / f'{url_key}.lock', blocking)
+
+
+class _FileLock:
+    """Serialises downloads of one URL across threads and processes.
+
+    Without blocking, locked is False when another holder has the lock.
+    """
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self.locked = False
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        self.locked = True
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.locked = False
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None and self.locked:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+_default_cache = None
+
+
+def fetch(url, revalidate=False, expected_size=None):
+    """fetch() on a cache configured from TLC_CACHE_DIR / TLC_CACHE_MAX_BYTES."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DownloadCache()
+    return _default_cache.fetch(url, revalidate=revalidate, expected_size=expected_size)
@@ -0,0 +1,162 @@
+"""Checks for download_cache.py against a local HTTP server.
+
+    uv run --with pytest pytest common/test_download_cache.py
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from download_cache import DownloadCache, _key
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves server.files ({path: bytes}) with ETag, conditional GET and Range."""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        etag = f'"{_key(data)}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', etag) == etag:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            body = data[start:]
+        else:
+            self.send_response(200)
+            body = data
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.files = {}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def serve(server, name, size):
+    data = os.urandom(size)
+    server.files[f'/{name}'] = data
+    return f'{server.url}/{name}', data
+
+
+def write_partial(cache, url, data, etag):
+    name = url.rsplit('/', 1)[-1]
+    part = cache.root / 'partial' / f'{_key(url)}-{name}.part'
+    part.write_bytes(data)
+    part.with_name(part.name + '.json').write_text(json.dumps({'etag': etag, 'last_modified': None}))
+
+
+def test_fresh_fetch_then_cached(tmp_path, server):
+    url, data = serve(server, 'yellow_tripdata_2021-01.parquet', 100_000)
+    cache = DownloadCache(tmp_path)
+
+    path = cache.fetch(url)
+    assert path.read_bytes() == data
+    assert cache.fetch(url, expected_size=len(data)) == path
+    assert len(server.requests) == 1
+
+
+def test_revalidate_not_modified(tmp_path, server):
+    url, data = serve(server, 'green_tripdata_2021-01.parquet', 1000)
+    cache = DownloadCache(tmp_path)
+    path = cache.fetch(url)
+
+    assert cache.fetch(url, revalidate=True) == path
+    assert len(server.requests) == 2
+    assert server.requests[1][1]['If-None-Match'] == f'"{_key(data)}"'
+    assert path.read_bytes() == data
+
+
+def test_resume_partial_download(tmp_path, server):
+    url, data = serve(server, 'fhv_tripdata_2021-01.parquet', 50_000)
+    cache = DownloadCache(tmp_path)
+    write_partial(cache, url, data[:20_000], f'"{_key(data)}"')
+
+    path = cache.fetch(url, expected_size=len(data))
+    assert path.read_bytes() == data
+    headers = server.requests[0][1]
+    assert headers['Range'] == 'bytes=20000-'
+    assert headers['If-Range'] == f'"{_key(data)}"'
+
+
+def test_resume_of_changed_file_starts_over(tmp_path, server):
+    url, data = serve(server, 'fhv_tripdata_2021-02.parquet', 50_000)
+    cache = DownloadCache(tmp_path)
+    # The partial file was of an older version: If-Range gets the whole file
+    write_partial(cache, url, os.urandom(20_000), '"old"')
+
+    assert cache.fetch(url).read_bytes() == data
+
+
+def test_range_not_satisfiable_starts_over(tmp_path, server):
+    url, data = serve(server, 'fhv_tripdata_2021-03.parquet', 1000)
+    cache = DownloadCache(tmp_path)
+    # As long as the remote file: the server answers the Range with 416
+    write_partial(cache, url, os.urandom(1000), f'"{_key(data)}"')
+
+    assert cache.fetch(url).read_bytes() == data
+    assert len(server.requests) == 2
+    assert 'Range' not in server.requests[1][1]
+
+
+def test_evicts_least_recently_used(tmp_path, server):
+    cache = DownloadCache(tmp_path, max_bytes=2500, min_age=0)
+    urls = [serve(server, f'month-{i}.parquet', 1000)[0] for i in range(3)]
+
+    first = cache.fetch(urls[0])
+    second = cache.fetch(urls[1])
+    cache.fetch(urls[0])  # now more recently used than the second
+    third = cache.fetch(urls[2])
+
+    assert first.exists() and third.exists()
+    assert not second.exists()
+
+
+def test_eviction_skips_recent_and_locked_files(tmp_path, server):
+    urls = [serve(server, f'month-{i}.parquet', 1000)[0] for i in range(3)]
+
+    # Just returned to another caller, which may not have opened it yet
+    cache = DownloadCache(tmp_path / 'recent', max_bytes=1500)
+    paths = [cache.fetch(url) for url in urls]
+    assert all(path.exists() for path in paths)
+
+    # Being fetched by another worker
+    cache = DownloadCache(tmp_path / 'locked', max_bytes=1500, min_age=0)
+    first = cache.fetch(urls[0])
+    with cache._lock(_key(urls[0])):
+        cache.fetch(urls[1])
+    assert first.exists()
+    cache.evict()
+    assert not first.exists()